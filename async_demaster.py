@@ -4,8 +4,13 @@ Removes nonsense like "Remastered" and "Live at".
 modified from original at https://github.com/hankhank10/demaster
 """
 
+import asyncio
+from collections import OrderedDict
+import json
 import logging
+import os
 import re
+import time
 
 import aiohttp
 
@@ -14,9 +19,177 @@ OFFLINE_PATTERN = re.compile(
     r"(\s(\(|-\s+))((199\d|20[0-2]\d)\s+)?(Remast|Live|Mono|From|Feat|Original|Motion|Deluxe).*", re.IGNORECASE
 )
 
+CACHE_SIZE = 1000
+NEGATIVE_CACHE_TTL = 300
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_COOLDOWN = 60
+BATCH_TIMEOUT = 5
+SAVE_DELAY = 30
+
 _LOGGER = logging.getLogger(__name__)
 
 
+class DemasterCache():
+    """Bounded LRU of full name -> short name with an optional JSON file store."""
+
+    def __init__(self, max_size=CACHE_SIZE, path=None):
+        """Initialize the cache, loading stored results if a path is given."""
+        self.max_size = max_size
+        self.path = os.path.expanduser(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._names = OrderedDict()
+        self._failures = {}
+        self._dirty = False
+        self._save_handle = None
+        self._save_lock = None
+
+        if self.path:
+            self._load()
+
+    def _load(self):
+        """Read previously stored results from disk."""
+        try:
+            with open(self.path, encoding="utf-8") as cache_file:
+                stored = json.load(cache_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as err:
+            _LOGGER.warning("Demaster cache unreadable, starting empty [%s]", err)
+            return
+
+        for mode, full_name, short_name in stored[-self.max_size:]:
+            self._names[(mode, full_name)] = short_name
+
+    def _save(self, stored):
+        """Write cached results to disk. Blocking."""
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.tmp", "w", encoding="utf-8") as cache_file:
+                json.dump(stored, cache_file)
+            os.replace(f"{self.path}.tmp", self.path)
+        except OSError as err:
+            _LOGGER.warning("Unable to save demaster cache [%s]", err)
+
+    def _schedule_save(self):
+        """Save changes after a delay, writing once for all names added meanwhile."""
+        self._dirty = True
+        if self._save_handle is None:
+            self._save_handle = asyncio.get_running_loop().call_later(
+                SAVE_DELAY, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Write the cached results to disk in an executor if they changed."""
+        if self._save_handle:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self._save_lock is None:
+            self._save_lock = asyncio.Lock()
+
+        async with self._save_lock:
+            if not self.path or not self._dirty:
+                return
+            self._dirty = False
+            stored = [[mode, full_name, short_name] for (mode, full_name), short_name in self._names.items()]
+            await asyncio.get_running_loop().run_in_executor(None, self._save, stored)
+
+    def __len__(self):
+        """Return the number of cached names."""
+        return len(self._names)
+
+    def get(self, mode, full_name):
+        """Return the cached short name or None."""
+        key = (mode, full_name)
+        short_name = self._names.get(key)
+        if short_name is None:
+            self.misses += 1
+            return None
+        self._names.move_to_end(key)
+        self.hits += 1
+        return short_name
+
+    def put(self, mode, full_name, short_name):
+        """Store a short name, evicting the least recently used beyond the limit."""
+        self._names[(mode, full_name)] = short_name
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+        if self.path:
+            self._schedule_save()
+
+    def record_failure(self, full_name):
+        """Remember that the API failed for a name."""
+        self._failures[full_name] = time.monotonic() + NEGATIVE_CACHE_TTL
+        if len(self._failures) > self.max_size:
+            now = time.monotonic()
+            self._failures = {name: expiry for name, expiry in self._failures.items() if expiry > now}
+
+    def recently_failed(self, full_name):
+        """Return True if the API failed for a name within the negative cache TTL."""
+        expiry = self._failures.get(full_name)
+        if expiry is None:
+            return False
+        if expiry < time.monotonic():
+            del self._failures[full_name]
+            return False
+        return True
+
+
+class CircuitBreaker():
+    """Stop calling an unreachable API until a cooldown has passed."""
+
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, cooldown=CIRCUIT_COOLDOWN):
+        """Initialize the breaker in the closed state."""
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0
+        self.trips = 0
+
+    def allow(self):
+        """Return True if a request may be attempted."""
+        return time.monotonic() >= self.open_until
+
+    def record_success(self):
+        """Close the breaker after a successful request."""
+        self.failures = 0
+
+    def record_failure(self):
+        """Count a failure, opening the breaker once the threshold is reached."""
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.allow():
+                self.trips += 1
+                _LOGGER.warning("Demaster API unavailable, using offline mode for %s seconds", self.cooldown)
+            self.open_until = time.monotonic() + self.cooldown
+
+
+_CACHE = DemasterCache()
+_BREAKER = CircuitBreaker()
+
+
+def configure_cache(path=None, max_size=CACHE_SIZE):
+    """Replace the result cache, optionally persisting it to a JSON file."""
+    global _CACHE  # pylint: disable=global-statement
+    _CACHE = DemasterCache(max_size, path)
+
+
+async def save_cache():
+    """Write pending cache changes to disk, e.g. on shutdown."""
+    await _CACHE.flush()
+
+
+def cache_stats():
+    """Return cache and circuit breaker counters for status reporting."""
+    return {
+        "hits": _CACHE.hits,
+        "misses": _CACHE.misses,
+        "cached": len(_CACHE),
+        "api_failures": _BREAKER.failures,
+        "circuit_open": not _BREAKER.allow(),
+        "circuit_trips": _BREAKER.trips,
+    }
+
+
 def strip_name_offline(full_song_name):
     """Use an offline regex to shorten the track name."""
     match = OFFLINE_PATTERN.search(full_song_name)
@@ -64,11 +237,66 @@ async def strip_name_api(session, full_song_name):
 
 async def strip_name(full_song_name, session=None, offline=False):
     """Main entry point."""
+    mode = "offline" if offline else "api"
+    short_name = _CACHE.get(mode, full_song_name)
+    if short_name is not None:
+        return short_name
+
     if offline:
+        short_name = strip_name_offline(full_song_name)
+        _CACHE.put(mode, full_song_name, short_name)
+        return short_name
+
+    if not _BREAKER.allow() or _CACHE.recently_failed(full_song_name):
         return strip_name_offline(full_song_name)
 
     try:
-        return await strip_name_api(session, full_song_name)
+        short_name = await strip_name_api(session, full_song_name)
     except ConnectionError:
+        _BREAKER.record_failure()
+        _CACHE.record_failure(full_song_name)
         _LOGGER.debug("Online API failed, returning offline version")
         return strip_name_offline(full_song_name)
+
+    _BREAKER.record_success()
+    _CACHE.put(mode, full_song_name, short_name)
+    return short_name
+
+
+async def strip_names(full_song_names, session=None, offline=False, timeout=BATCH_TIMEOUT):
+    """Demaster a list of names, returning the short names in the same order.
+
+    In cloud mode the API requests run concurrently and share one overall deadline,
+    names that miss it fall back to the offline version.
+    """
+    unique_names = list(dict.fromkeys(full_song_names))
+
+    if offline:
+        short_names = {name: await strip_name(name, offline=True) for name in unique_names}
+        return [short_names[name] for name in full_song_names]
+
+    if session is None:
+        local_session = True
+        session = aiohttp.ClientSession()
+    else:
+        local_session = False
+
+    tasks = {name: asyncio.ensure_future(strip_name(name, session)) for name in unique_names}
+    _, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+        _BREAKER.record_failure()
+        _LOGGER.debug("Demaster API missed the %s second deadline for %s names", timeout, len(pending))
+
+    if local_session:
+        await session.close()
+
+    short_names = {}
+    for name, task in tasks.items():
+        if task.cancelled() or task.exception():
+            short_names[name] = strip_name_offline(name)
+        else:
+            short_names[name] = task.result()
+    return [short_names[name] for name in full_song_names]
@@ -0,0 +1,166 @@
+"""
+Async Last.fm client sharing one aiohttp session, with cached play counts.
+"""
+import asyncio
+from datetime import datetime
+import logging
+import time
+from types import SimpleNamespace
+
+from aiohttp import ClientTimeout
+
+from lastfm_user_data import lastfm_public_key, period_start_time
+
+_LOGGER = logging.getLogger(__name__)
+
+API_URL = "http://ws.audioscrobbler.com/2.0/"
+REQUEST_TIMEOUT = ClientTimeout(total=10)
+RECENT_LIMIT = 200
+RECENT_TTL = 5
+
+# Seconds a fetched period total is trusted before it is fetched again.
+# In between, new scrobbles are added to it from the recent tracks.
+PERIOD_TTLS = {
+    "": 3600,
+    "this_year": 3600,
+    "this_month": 1800,
+    "last30days": 1800,
+    "this_week": 900,
+    "last7days": 900,
+    "today": 300,
+}
+DEFAULT_TTL = 60
+
+# Periods whose start moves with the clock, so an old total can't be topped up
+ROLLING_PERIODS = ("last24hours", "last_hour")
+
+
+def period_start(period, time_now=None):
+    """Return the start of a period as a Unix timestamp, or None for all time."""
+    start_time = period_start_time(period, time_now)
+    if start_time is None:
+        return None
+    return int(datetime.timestamp(start_time))
+
+
+class LastfmClient():
+    """Fetch the recent tracks and play counts of a Last.fm user."""
+
+    def __init__(self, session, username, api_key=lastfm_public_key):
+        """Initialize the client."""
+        self.session = session
+        self.username = username
+        self.api_key = api_key
+        self._recent = None
+        self._recent_at = 0
+        self._scrobbles = []
+        self._recent_complete = False
+        self._totals = {}
+        self.requests = 0
+        self.fetched = 0
+        self.computed = 0
+
+    async def _get_recent_tracks(self, **params):
+        """Return the `recenttracks` object of a user.getrecenttracks request."""
+        query = {
+            "method": "user.getrecenttracks",
+            "user": self.username,
+            "api_key": self.api_key,
+            "format": "json",
+        }
+        query.update({key: str(value) for key, value in params.items()})
+        self.requests += 1
+        async with self.session.get(API_URL, params=query, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            obj = await response.json(content_type=None)
+        return obj['recenttracks']
+
+    async def recent_tracks(self):
+        """Fetch the latest page of recent tracks and remember their timestamps."""
+        recent = await self._get_recent_tracks(limit=RECENT_LIMIT)
+        tracks = recent['track']
+        # The track being scrobbled right now has no date yet
+        self._scrobbles = [int(track['date']['uts']) for track in tracks if 'date' in track]
+        self._recent_complete = int(recent['@attr']['total']) <= len(self._scrobbles)
+        self._recent = recent
+        self._recent_at = time.monotonic()
+        return tracks
+
+    async def lastplayed(self):
+        """Return the name, artist, album and image URL of the last played track."""
+        track = (await self.recent_tracks())[0]
+        return track['name'], track['artist']['#text'], track['album']['#text'], track['image'][3]['#text']
+
+    def _count_since(self, timestamp):
+        """Return the scrobbles at or after `timestamp` in the recent tracks, or None if not all are known."""
+        scrobbles = self._scrobbles
+        if not self._recent_complete and (not scrobbles or scrobbles[-1] >= timestamp):
+            return None
+        return sum(1 for uts in scrobbles if uts >= timestamp)
+
+    def _cached_playcount(self, period, start):
+        """Return a play count computed without a request, or None."""
+        if period in ROLLING_PERIODS:
+            return self._count_since(start)
+
+        cached = self._totals.get(period)
+        if cached is None or cached.start != start:
+            return None
+        if time.monotonic() - cached.fetched_at > PERIOD_TTLS.get(period, DEFAULT_TTL):
+            return None
+
+        new_scrobbles = self._count_since(cached.as_of + 1)
+        if new_scrobbles is None:
+            return None
+        return cached.total + new_scrobbles
+
+    async def _fetch_playcount(self, period, start):
+        """Fetch the total play count of a period from the API."""
+        as_of = int(time.time())
+        params = {"limit": 1}
+        if start is not None:
+            params["from"] = start
+        recent = await self._get_recent_tracks(**params)
+        total = int(recent['@attr']['total'])
+        self._totals[period] = SimpleNamespace(
+            start=start, total=total, as_of=as_of, fetched_at=time.monotonic())
+        return total
+
+    async def playcounts(self, periods):
+        """Return a dict of play counts by period ("" being all time).
+
+        Counts still covered by a recent total are topped up with newer scrobbles,
+        the others are fetched concurrently.
+        """
+        if time.monotonic() - self._recent_at > RECENT_TTL:
+            await self.recent_tracks()
+
+        time_now = datetime.now()
+        counts = {}
+        to_fetch = {}
+        for period in periods:
+            start = period_start(period, time_now)
+            count = self._cached_playcount(period, start)
+            if count is None:
+                to_fetch[period] = start
+            else:
+                counts[period] = count
+
+        self.computed += len(counts)
+        self.fetched += len(to_fetch)
+        if to_fetch:
+            _LOGGER.debug("Fetching play counts for %s", list(to_fetch))
+            results = await asyncio.gather(
+                *[self._fetch_playcount(period, start) for period, start in to_fetch.items()])
+            counts.update(zip(to_fetch, results))
+
+        return counts
+
+    def stats(self):
+        """Return client statistics for status reporting."""
+        return {
+            "requests": self.requests,
+            "playcounts_fetched": self.fetched,
+            "playcounts_computed": self.computed,
+            "recent_scrobbles": len(self._scrobbles),
+        }
@@ -0,0 +1,59 @@
+"""
+Record webhook payloads and polled `/state` responses for offline replay.
+"""
+import json
+import logging
+import os
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PayloadRecorder():
+    """Append timestamped payloads to a JSON lines file."""
+
+    def __init__(self, path):
+        """Open the capture file for appending."""
+        self.path = os.path.expanduser(path)
+        self.recorded = 0
+        capture_dir = os.path.dirname(self.path)
+        if capture_dir:
+            os.makedirs(capture_dir, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+        _LOGGER.info("Recording payloads to %s", self.path)
+
+    def record_webhook(self, room, payload):
+        """Record the state sent with a webhook."""
+        self._write({"kind": "webhook", "room": room, "payload": payload})
+
+    def record_poll(self, room, body, status=200):
+        """Record the raw body (or None if not modified) of a polled `/state` response."""
+        if body is not None:
+            body = body.decode("utf-8", errors="replace")
+        self._write({"kind": "poll", "room": room, "status": status, "body": body})
+
+    def _write(self, entry):
+        """Write one timestamped entry per line."""
+        entry["time"] = time.time()
+        try:
+            self._file.write(json.dumps(entry) + "\n")
+        except (OSError, ValueError) as err:
+            _LOGGER.warning("Could not record payload: %s", err)
+            return
+        self.recorded += 1
+
+    def close(self):
+        """Close the capture file."""
+        self._file.close()
+
+    def stats(self):
+        """Return recorder statistics for status reporting."""
+        return {"path": self.path, "recorded": self.recorded}
+
+
+def read_capture(path):
+    """Yield the entries of a capture file in recorded order."""
+    with open(os.path.expanduser(path), encoding="utf-8") as capture_file:
+        for line in capture_file:
+            if line.strip():
+                yield json.loads(line)
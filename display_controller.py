@@ -1,36 +1,43 @@
 """Implementation of the DisplayController class."""
+import _tkinter
 import logging
 import os
+import time
 import tkinter as tk
-from tkinter import Y, font as tkFont
 
 from PIL import ImageTk
 
+from font_registry import prewarm_tk, tk_font
 from hyperpixel_backlight import Backlight
+from render_backend import RenderBackend, SonosDisplaySetupError
+from render_cache import DEFAULT_MAX_BYTES
 
 _LOGGER = logging.getLogger(__name__)
 
-class SonosDisplaySetupError(Exception):
-    """Error connecting to Sonos display."""
+IMAGE_FIELDS = ("code_image", "album_frame", "thumb_frame")
+FONT_FAMILY = "consolas"
+DETAIL_FONT_SIZE = 14
+TRACK_FONT_SIZES = (22, 27, 37)
+DEFAULT_FRAME_RATE = 30
+# Still handle window system events this often when nothing asks for a frame
+IDLE_PUMP_INTERVAL = 1
+MAX_EVENTS_PER_FRAME = 200
 
-class DisplayController:  # pylint: disable=too-many-instance-attributes
+class DisplayController(RenderBackend):  # pylint: disable=too-many-instance-attributes
     """Controller to handle the display hardware and GUI interface."""
 
-    def __init__(self, loop, show_details, show_artist_and_album, show_details_timeout, overlay_text, show_play_state, show_spotify_code):
-        """Initialize the display controller."""
+    def __init__(self, loop, show_details, show_artist_and_album, show_details_timeout, overlay_text, show_play_state, show_spotify_code, render_cache_size=DEFAULT_MAX_BYTES, frame_rate=DEFAULT_FRAME_RATE):
+        """Initialize the display controller, repainting at most `frame_rate` times per second."""
+        super().__init__(loop, show_details, show_artist_and_album, show_details_timeout, overlay_text,
+                         show_play_state, show_spotify_code, render_cache_size)
 
-        self.SCREEN_W = 720
-        self.SCREEN_H = 720
-        self.THUMB_W = 0
-        self.THUMB_H = 0
-
-        self.loop = loop
-        self.show_details = show_details
-        self.show_artist_and_album = show_artist_and_album
-        self.show_details_timeout = show_details_timeout
-        self.overlay_text = overlay_text
-        self.show_play_state = show_play_state
-        self.show_spotify_code = show_spotify_code
+        self.frame_interval = 1 / frame_rate
+        self.frames = 0
+        self.frame_requests = 0
+        self._frame_handle = None
+        self._pump_handle = None
+        self._last_frame = 0
+        self._power_on_after_frame = False
 
         self.album_image = None
         self.thumb_image = None
@@ -42,8 +49,6 @@ class DisplayController:  # pylint: disable=too-many-instance-attributes
         self.label_spotify_code_detail = None
         self.track_font = None
         self.detail_font = None
-        self.timeout_future = None
-        self.is_showing = False
 
         self.backlight = Backlight()
 
@@ -81,8 +86,10 @@ class DisplayController:  # pylint: disable=too-many-instance-attributes
         self.detail_text = tk.StringVar()
         self.play_state_text = tk.StringVar()
 
-        self.detail_font = tkFont.Font(family="consolas", size=14)
-        self.play_state_font = tkFont.Font(family="consolas", size=14)
+        # Load every font size used by compute_layout() now so track changes never wait on it
+        prewarm_tk(FONT_FAMILY, (DETAIL_FONT_SIZE,) + TRACK_FONT_SIZES)
+        self.detail_font = tk_font(FONT_FAMILY, DETAIL_FONT_SIZE)
+        self.play_state_font = tk_font(FONT_FAMILY, DETAIL_FONT_SIZE)
 
         self.label_albumart = tk.Label(
             self.album_frame,
@@ -122,6 +129,7 @@ class DisplayController:  # pylint: disable=too-many-instance-attributes
         self.label_play_state = tk.Label(
             self.detail_frame,
             textvariable=self.play_state_text,
+            font=self.play_state_font,
             fg="white",
             bg="black",
             wraplength=700,
@@ -135,8 +143,6 @@ class DisplayController:  # pylint: disable=too-many-instance-attributes
             fg="white",
             bg="#368A7D",
         )
-        self.label_spotify_code.place(relx=0.75, y=40, anchor=tk.N)
-        
         self.label_spotify_code_detail = tk.Label(
             self.detail_frame,
             image=None,
@@ -145,13 +151,45 @@ class DisplayController:  # pylint: disable=too-many-instance-attributes
             fg="white",
             bg="#368A7D",
         )
-        self.label_spotify_code_detail.place(relx=0.75, y=40, anchor=tk.N)
 
         self.album_frame.grid_propagate(False)
         self.detail_frame.grid_propagate(False)
 
         self.root.attributes("-fullscreen", True)
         self.root.update()
+        self._last_frame = time.monotonic()
+        self._pump_handle = self.loop.call_later(IDLE_PUMP_INTERVAL, self._pump)
+
+    def request_frame(self):
+        """Repaint on the next frame tick, coalescing all requests made before it."""
+        self.frame_requests += 1
+        if self._frame_handle is None:
+            delay = max(self._last_frame + self.frame_interval - time.monotonic(), 0)
+            self._frame_handle = self.loop.call_later(delay, self._on_frame_tick)
+
+    def _process_events(self):
+        """Run pending Tk events and idle tasks (geometry and redraws) without blocking."""
+        for _ in range(MAX_EVENTS_PER_FRAME):
+            if not self.root.tk.dooneevent(_tkinter.ALL_EVENTS | _tkinter.DONT_WAIT):
+                break
+
+    def _on_frame_tick(self):
+        """Frame tick: paint everything changed since the last one."""
+        self._frame_handle = None
+        self._process_events()
+        self._last_frame = time.monotonic()
+        self.frames += 1
+
+        # Only light the screen once the new frame is painted
+        if self._power_on_after_frame:
+            self._power_on_after_frame = False
+            self.backlight.set_power(True)
+
+    def _pump(self):
+        """Handle window system events arriving while no frame is requested."""
+        self._pump_handle = self.loop.call_later(IDLE_PUMP_INTERVAL, self._pump)
+        if self._frame_handle is None:
+            self._process_events()
 
     def show_album(self, show_details=None, detail_timeout=None):
         """Show album with optional detail display and timeout."""
@@ -162,201 +200,138 @@ class DisplayController:  # pylint: disable=too-many-instance-attributes
         if show_details is None and detail_timeout is None:
             self.curtain_frame.lower()
         elif show_details:
+            self._detail_view = True
             self.detail_frame.lift()
             if detail_timeout:
                 if self.timeout_future:
                     self.timeout_future.cancel()
                 self.timeout_future = self.loop.call_later(detail_timeout, handle_timeout)
         else:
+            self._detail_view = False
             self.album_frame.lift()
 
         self.is_showing = True
-        self.root.update()
-        self.backlight.set_power(True)
+        self._power_on_after_frame = True
+        self.request_frame()
+        self.export()
 
     def hide_album(self):
         """Hide album if showing."""
+        if not self.is_showing and not self.timeout_future:
+            return
+
         if self.timeout_future:
             self.timeout_future.cancel()
             self.timeout_future = None
             self.show_album(show_details=False)
 
         self.is_showing = False
+        self._power_on_after_frame = False
         self.backlight.set_power(False)
         self.curtain_frame.lift()
-        self.root.update()
-        self.label_spotify_code.destroy()
-        self.label_spotify_code_detail.destroy()
-
-    def update(self, code_image, image, sonos_data):
-        """Update displayed image and text."""
-
-        def resize_image(image, length):
-            """Resizes the image, assumes square image."""
-            image = image.resize((length, length), ImageTk.Image.ANTIALIAS)
-            return ImageTk.PhotoImage(image)
-
-        if code_image != None:
-           code_image = ImageTk.PhotoImage(code_image)
-
-        display_trackname = sonos_data.trackname or sonos_data.station
-
-        detail_text = ""
-        play_state_text = ""
-
-        if self.show_artist_and_album:
-            detail_prefix = None
-            detail_suffix = sonos_data.album or None
-
-            if sonos_data.artist != display_trackname:
-                detail_prefix = sonos_data.artist
-
-            detail_text = " • ".join(filter(None, [detail_prefix, detail_suffix]))
-
-        if self.show_play_state:
-            play_state_volume = sonos_data.volume or None
-            play_state_shuffle = sonos_data.shuffle or None
-            play_state_repeat = sonos_data.repeat or None
-            play_state_crossfade = sonos_data.crossfade or None
-
-            play_state_volume_text = "Volume: " + str(play_state_volume)
-
-            play_state_shuffle_text = "Shuffle: " + str(play_state_shuffle).capitalize()
-
-            play_state_repeat_text = "Repeat: " + str(play_state_repeat).capitalize()
+        self.request_frame()
+        self.label_spotify_code.place_forget()
+        self.label_spotify_code_detail.place_forget()
+        self._rendered.pop("code_image", None)
+        self.export()
+
+    def apply(self, frame):
+        """Push a prepared frame to the Tk widgets, touching only those whose inputs changed. Must run on the Tk thread."""
+        last = self._rendered
+
+        def changed(*fields):
+            """Return True if any of the frame fields differ from the last rendered frame."""
+            for field in fields:
+                if field not in last:
+                    return True
+                if field in IMAGE_FIELDS:
+                    # Compare by identity, PIL equality would compare every pixel
+                    if last[field] is not getattr(frame, field):
+                        return True
+                elif last[field] != getattr(frame, field):
+                    return True
+            return False
+
+        if changed("thumb_length", "track_font_size"):
+            self.THUMB_H = frame.thumb_length
+            self.THUMB_W = frame.thumb_length
+            self.track_font = tk_font(FONT_FAMILY, frame.track_font_size)
+            self.label_track.configure(font=self.track_font)
+            self.label_track.place(relx=0.5, y=self.THUMB_H + 10, anchor=tk.N)
+            if self.overlay_text:
+                self.label_albumart_detail.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+            else:
+                self.label_albumart_detail.place(relx=0.5, y=self.THUMB_H / 2, anchor=tk.CENTER)
 
-            play_state_crossfade_text = "Crossfade: " + str(play_state_crossfade).capitalize()
+        # Store the images as attributes to preserve scope for Tk
+        if changed("album_frame"):
+            self.album_image = ImageTk.PhotoImage(frame.album_frame)
+            self.label_albumart.configure(image=self.album_image)
+
+        if changed("album_frame", "thumb_frame"):
+            if frame.thumb_frame is frame.album_frame:
+                # Both labels can share a single Tk image when the sizes match
+                self.thumb_image = self.album_image
+            else:
+                self.thumb_image = ImageTk.PhotoImage(frame.thumb_frame)
+            self.label_albumart_detail.configure(image=self.thumb_image)
 
-            play_state_text = " • ".join(filter(None, [play_state_volume_text, play_state_shuffle_text, play_state_repeat_text, play_state_crossfade_text]))
+        if changed("display_trackname"):
+            self.track_name.set(frame.display_trackname)
 
-        if self.show_artist_and_album:
-            if len(display_trackname) > 27:
-                if len(detail_text) > 54:
-                    self.THUMB_H = 565
-                    self.THUMB_W = 565
-                else:
-                    self.THUMB_H = 590
-                    self.THUMB_W = 590
-                if detail_text == "":
-                    self.track_font = tkFont.Font(family="consolas", size=27)
-                else:
-                    self.track_font = tkFont.Font(family="consolas", size=22)
+        if changed("detail_text"):
+            self.detail_text.set(frame.detail_text)
+            if frame.detail_text == "" or not self.show_artist_and_album:
+                self.label_detail.place_forget()
             else:
-                if len(detail_text) > 54:
-                    self.THUMB_H = 600
-                    self.THUMB_W = 600
-                else:
-                    self.THUMB_H = 620
-                    self.THUMB_W = 620
-                if detail_text == "":
-                    self.track_font = tkFont.Font(family="consolas", size=37)
-                    self.THUMB_H = self.THUMB_H + 20
-                    self.THUMB_W = self.THUMB_W + 20
-                else:
-                    self.track_font = tkFont.Font(family="consolas", size=27)
-
-            if len(display_trackname) > 27 and len(display_trackname) < 34:
-                self.THUMB_H = self.THUMB_H + 40
-                self.THUMB_W = self.THUMB_W + 40
-            
-        else:
-            if len(display_trackname) > 22:
-                self.THUMB_H = 610
-                self.THUMB_W = 610
-                self.track_font = tkFont.Font(family="consolas", size=27)
+                self.label_detail.place(relx=0.5, y=self.SCREEN_H - 10, anchor=tk.S)
+
+        if changed("play_state_text"):
+            self.play_state_text.set(frame.play_state_text)
+            if self.show_play_state:
+                self.label_play_state.place(relx=0.5, y=10, anchor=tk.N)
+
+        if changed("code_image", "detail_text"):
+            if not self.show_spotify_code or frame.code_image == None or frame.detail_text == "":
+                self.code_image = None
+                self.label_spotify_code.place_forget()
+                self.label_spotify_code_detail.place_forget()
             else:
-                self.THUMB_H = 640
-                self.THUMB_W = 640
-                self.track_font = tkFont.Font(family="consolas", size=37)
+                if changed("code_image"):
+                    self.code_image = ImageTk.PhotoImage(frame.code_image)
+                    self.label_spotify_code.configure(image=self.code_image)
+                    self.label_spotify_code_detail.configure(image=self.code_image)
+                self.label_spotify_code.place(relx=0.75, y=40, anchor=tk.N)
+                self.label_spotify_code_detail.place(relx=0.75, y=40, anchor=tk.N)
 
-            if len(display_trackname) > 22 and len(display_trackname) < 35:
-                self.THUMB_H = self.THUMB_H + 40
-                self.THUMB_W = self.THUMB_W + 40
+        self._frame = frame
+        self._rendered = vars(frame).copy()
 
-        # Store the images as attributes to preserve scope for Tk
-        self.album_image = resize_image(image, self.SCREEN_W)
-        if self.overlay_text:
-            self.thumb_image = resize_image(image, self.SCREEN_W)
-            self.label_albumart_detail.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
-        else:
-            self.thumb_image = resize_image(image, self.THUMB_W)
-            self.label_albumart_detail.place(relx=0.5, y=self.THUMB_H / 2, anchor=tk.CENTER)
+        self.show_album(self.show_details, self.show_details_timeout)
 
-        self.label_track.place(relx=0.5, y=self.THUMB_H + 10, anchor=tk.N)
+    def update_play_state(self, track_info):
+        """Redraw only the play state line (volume, shuffle, repeat, crossfade)."""
+        play_state_text = self.build_play_state_text(track_info)
+        if not self.replace_play_state(play_state_text):
+            return
 
-        if detail_text == "" or not self.show_artist_and_album:
-            self.label_detail.destroy()
-        else:
-            if self.label_detail.winfo_exists() == 0:
-                self.label_detail = tk.Label(
-                    self.detail_frame,
-                    textvariable=self.detail_text,
-                    font=self.detail_font,
-                    fg="white",
-                    bg="black",
-                    wraplength=600,
-                    justify="center",
-                )
-            self.label_detail.place(relx=0.5, y=self.SCREEN_H - 10, anchor=tk.S)
-            self.label_detail.configure(font=self.detail_font)
-
-        if not self.show_play_state:
-            self.label_play_state.destroy()
-        else:
-            if self.label_play_state.winfo_exists() == 0:
-                self.label_play_state = tk.Label(
-                    self.detail_frame,
-                    textvariable=self.play_state_text,
-                    font=self.play_state_font,
-                    fg="white",
-                    bg="black",
-                    wraplength=700,
-                    justify="center",
-                )
-            self.label_play_state.place(relx=0.5, y= 10, anchor=tk.N)
-            self.label_play_state.configure(font=self.play_state_font)
-
-        if not self.show_spotify_code or code_image == None  or detail_text == "":
-            self.label_spotify_code.destroy()
-            self.label_spotify_code_detail.destroy()
-        else:
-            if self.label_spotify_code.winfo_exists() == 0:
-                self.label_spotify_code = tk.Label(
-                    self.album_frame,
-                    image=None,
-                    borderwidth=0,
-                    highlightthickness=0,
-                    fg="white",
-                    bg="#368A7D",
-                )
-                self.label_spotify_code.place(relx=0.75, y=40, anchor=tk.N)
-            if code_image != None:
-                self.label_spotify_code.configure(image=code_image)
-                
-            if self.label_spotify_code_detail.winfo_exists() == 0:
-                self.label_spotify_code_detail = tk.Label(
-                    self.detail_frame,
-                    image=None,
-                    borderwidth=0,
-                    highlightthickness=0,
-                    fg="white",
-                    bg="#368A7D",
-                )
-                self.label_spotify_code_detail.place(relx=0.75, y=40, anchor=tk.N)
-            if code_image != None:
-                self.label_spotify_code_detail.configure(image=code_image) 
-
-        self.label_albumart.configure(image=self.album_image)
-        self.label_albumart_detail.configure(image=self.thumb_image)
-        self.label_track.configure(font=self.track_font)
-        self.track_name.set(display_trackname)
-        self.detail_text.set(detail_text)
         self.play_state_text.set(play_state_text)
-        
-        self.root.update_idletasks()
-        self.show_album(self.show_details, self.show_details_timeout)
+        self.request_frame()
+        if self.is_showing and self._detail_view:
+            self.export()
+
+    def stats(self):
+        """Return frame counters for status reporting."""
+        return {
+            "frames": self.frames,
+            "frame_requests": self.frame_requests,
+            "frame_rate": round(1 / self.frame_interval),
+        }
 
     def cleanup(self):
         """Run cleanup actions."""
+        for handle in (self._frame_handle, self._pump_handle):
+            if handle:
+                handle.cancel()
         self.backlight.cleanup()
 
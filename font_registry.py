@@ -0,0 +1,45 @@
+"""
+Shared registry of loaded fonts for the Tk and Inky renderers.
+Each (family, size) is created once and then served from memory.
+"""
+import functools
+import logging
+
+from PIL import ImageFont
+
+try:
+    from tkinter import font as tkFont
+except ImportError:
+    tkFont = None
+
+_LOGGER = logging.getLogger(__name__)
+
+_TK_FONTS = {}
+
+
+def tk_font(family, size):
+    """Return a Tk font for (family, size). A Tk root must exist."""
+    key = (family, size)
+    font = _TK_FONTS.get(key)
+    if font is None:
+        font = _TK_FONTS[key] = tkFont.Font(family=family, size=size)
+    return font
+
+
+@functools.lru_cache(maxsize=None)
+def truetype(font_path, size):
+    """Return a PIL TrueType font for (path, size), loading the file only once."""
+    return ImageFont.truetype(font_path, size)
+
+
+def prewarm_tk(family, sizes):
+    """Create the Tk fonts for a family ahead of first use."""
+    for size in sizes:
+        tk_font(family, size)
+    _LOGGER.debug("Loaded %s font sizes %s", family, sizes)
+
+
+def prewarm_truetype(font_path, sizes):
+    """Load PIL TrueType fonts ahead of first use."""
+    for size in sizes:
+        truetype(font_path, size)
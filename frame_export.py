@@ -0,0 +1,179 @@
+"""
+Publish rendered frames to a memory-mapped ring buffer for other local processes.
+
+File layout, little endian:
+  header: magic b"MSAF", version u32, slots u32, slot size u32, latest sequence u64
+  slots:  sequence u64, width u32, height u32, channels u32, length u32,
+          time f64, track id (256 bytes of UTF-8, zero padded), pixels
+
+Frame `seq` is stored in slot `seq % slots`. A slot's sequence is 0 while it is
+being written, so readers copying a frame check it is unchanged afterwards.
+"""
+from io import BytesIO
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from types import SimpleNamespace
+
+from PIL import Image
+
+_LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"MSAF"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIQ")
+LATEST_OFFSET = HEADER.size - 8
+SLOT_HEADER = struct.Struct("<QIIIId256s")
+TRACK_ID_BYTES = 256
+
+DEFAULT_EXPORT_FILE = "/dev/shm/music-screen-api-frames"
+DEFAULT_SLOTS = 3
+MAX_FRAME_BYTES = 720 * 720 * 3
+CHANNELS = {"L": 1, "RGB": 3}
+MODES = {channels: mode for mode, channels in CHANNELS.items()}
+
+
+class FrameExporter():
+    """Write frames into the ring buffer and serve the latest one as PNG."""
+
+    def __init__(self, path=DEFAULT_EXPORT_FILE, slots=DEFAULT_SLOTS, max_frame_bytes=MAX_FRAME_BYTES):
+        """Create or resize the ring buffer file and map it."""
+        self.path = path
+        self.slots = slots
+        self.slot_size = SLOT_HEADER.size + max_frame_bytes
+        self.max_frame_bytes = max_frame_bytes
+        self.seq = 0
+        self.published = 0
+        self.encoded = 0
+
+        size = HEADER.size + slots * self.slot_size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, slots, self.slot_size, 0)
+
+        self._image = None
+        self._image_seq = 0
+        self._png = None
+        self._png_seq = 0
+        self._lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        _LOGGER.info("Exporting frames to %s", path)
+
+    def publish(self, image, track_id=""):
+        """Write a frame to the next slot and make it the latest."""
+        if image.mode not in CHANNELS:
+            image = image.convert("RGB")
+        data = image.tobytes()
+        if len(data) > self.max_frame_bytes:
+            _LOGGER.warning("Frame of %sx%s is too large to export", image.width, image.height)
+            return
+
+        seq = self.seq + 1
+        offset = HEADER.size + (seq % self.slots) * self.slot_size
+        track_bytes = track_id.encode("utf-8")[:TRACK_ID_BYTES]
+        SLOT_HEADER.pack_into(self._map, offset, 0, 0, 0, 0, 0, 0, b"")
+        pixels = offset + SLOT_HEADER.size
+        self._map[pixels:pixels + len(data)] = data
+        SLOT_HEADER.pack_into(self._map, offset, seq, image.width, image.height,
+                              CHANNELS[image.mode], len(data), time.time(), track_bytes)
+        struct.pack_into("<Q", self._map, LATEST_OFFSET, seq)
+
+        self.seq = seq
+        self.published += 1
+        with self._lock:
+            self._image = image
+            self._image_seq = seq
+
+    def png(self):
+        """Return the latest frame as PNG data, encoding each frame at most once. Blocking."""
+        with self._encode_lock:
+            with self._lock:
+                image, seq = self._image, self._image_seq
+            if image is None:
+                return None
+            if seq != self._png_seq:
+                buffer = BytesIO()
+                image.save(buffer, "PNG")
+                self._png = buffer.getvalue()
+                self._png_seq = seq
+                self.encoded += 1
+            return self._png
+
+    def close(self):
+        """Unmap the ring buffer."""
+        self._map.close()
+
+    def stats(self):
+        """Return exporter statistics for status reporting."""
+        return {"path": self.path, "seq": self.seq, "published": self.published, "png_encoded": self.encoded}
+
+
+class FrameReader():
+    """Read frames published by a FrameExporter in another process."""
+
+    def __init__(self, path=DEFAULT_EXPORT_FILE):
+        """Map the ring buffer read-only."""
+        with open(path, "rb") as export_file:
+            self._map = mmap.mmap(export_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slots, self.slot_size, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} frame export")
+
+    def latest_seq(self):
+        """Return the sequence number of the latest frame, 0 if none yet."""
+        return struct.unpack_from("<Q", self._map, LATEST_OFFSET)[0]
+
+    def _slot(self, seq):
+        """Return the header and a zero-copy view of the pixels of a frame, or None if overwritten."""
+        offset = HEADER.size + (seq % self.slots) * self.slot_size
+        slot_seq, width, height, channels, length, frame_time, track_id = SLOT_HEADER.unpack_from(self._map, offset)
+        if slot_seq != seq:
+            return None
+        header = SimpleNamespace(
+            seq=seq, width=width, height=height, channels=channels, time=frame_time,
+            track_id=track_id.rstrip(b"\0").decode("utf-8", errors="ignore"))
+        pixels = offset + SLOT_HEADER.size
+        return header, memoryview(self._map)[pixels:pixels + length]
+
+    def latest(self):
+        """Return (header, pixels) of the latest frame without copying, or None.
+
+        The pixels may be overwritten after `slots - 1` newer frames, check
+        `is_current(header)` once done with them.
+        """
+        seq = self.latest_seq()
+        if not seq:
+            return None
+        return self._slot(seq)
+
+    def is_current(self, header):
+        """Return True if a frame has not been overwritten since it was read."""
+        offset = HEADER.size + (header.seq % self.slots) * self.slot_size
+        return struct.unpack_from("<Q", self._map, offset)[0] == header.seq
+
+    def read_image(self):
+        """Return (header, PIL image) with a consistent copy of the latest frame, or None."""
+        while True:
+            seq = self.latest_seq()
+            if not seq:
+                return None
+            frame = self._slot(seq)
+            if frame is None:
+                # Being written or already overwritten, try the new latest frame
+                continue
+            header, pixels = frame
+            data = bytes(pixels)
+            pixels.release()
+            if self.is_current(header):
+                return header, Image.frombytes(MODES[header.channels], (header.width, header.height), data)
+
+    def close(self):
+        """Unmap the ring buffer."""
+        self._map.close()
@@ -1,10 +1,10 @@
-import time # needed to delay x seconds between checks
-import lastfm_user_data # the api which pulls the lastfm data
+import asyncio
 import sys # needed to pull command line arguments
-import ink_printer # does the printing to ink
 
-# set globals
-previous_track_name = ""
+from aiohttp import ClientError, ClientSession
+
+from async_lastfm import LastfmClient # the api which pulls the lastfm data
+import ink_printer # does the printing to ink
 
 # define variables
 display_stats = False # can be set to detailed or summary
@@ -15,6 +15,48 @@ if display_stats == True:
 if display_stats == False:
     frequency = 1  # number of seconds between checks of the API
 
+# the periods shown when display_stats is on, with their labels ("" is all time)
+stats_periods = [("", "all time"), ("this_year", "this year"), ("this_month", "this month"), ("this_week", "this week"), ("today", "today")]
+
+async def main(requested_username):
+    previous_track_name = ""
+
+    async with ClientSession() as session:
+        lastfm = LastfmClient(session, requested_username)
+
+        # loop to refresh every [frequency] seconds
+        while True:
+            # gather last played information from lastfm api
+            print ("Checking API for last played: ", end = '')
+            try:
+                lastplayed_track, lastplayed_artist, lastplayed_album, lastplayed_image = await lastfm.lastplayed()
+
+                # see if there is new data to display
+                if lastplayed_track == previous_track_name:  #check if the track name is same as what we displayed last time
+                    print ("no change to data - not refreshing")
+                else:
+                    print ("new data found from api - refreshing screen")
+
+                    if display_stats == True:
+                        # find more info, fetching only the counts which can't be worked out from recent tracks
+                        playcounts = await lastfm.playcounts([period for period, label in stats_periods])
+                        stats = [str(playcounts[period]) + " " + label for period, label in stats_periods]
+
+                        # print to the ink
+                        ink_printer.print_text_to_ink (lastplayed_track, lastplayed_artist, lastplayed_album, *stats)
+
+                    if display_stats == False:
+                        #print to the ink
+                        ink_printer.print_text_to_ink (lastplayed_track, lastplayed_artist, lastplayed_album)
+
+                    # keep a record of the previous track name to see if it changes next time
+                    previous_track_name = lastplayed_track
+            except (ClientError, asyncio.TimeoutError) as err:
+                print ("Error: last.fm failed to answer (" + str(err) + ")")
+
+            print ("Waiting " + str(frequency) + " seconds")
+            await asyncio.sleep (frequency)
+
 # check if a command line argument has been passed to identify the user, if not ask
 if len(sys.argv) == 1:
     # if no username passed then ask the user to input a username
@@ -22,37 +64,11 @@ if len(sys.argv) == 1:
 else:
     # if command line includes username then set it to that
     requested_username = str(sys.argv[1])
-    
-# loop to refresh every [frequency] seconds
-while True:
-    # gather last played information from lastfm api
-    print ("Checking API for last played: ", end = '')
-    lastplayed_track, lastplayed_artist, lastplayed_album, lastplayed_image = lastfm_user_data.lastplayed (requested_username)
-    
-    # see if there is new data to display
-    if lastplayed_track == previous_track_name:  #check if the track name is same as what we displayed last time
-        print ("no change to data - not refreshing")
-    else:
-        print ("new data found from api - refreshing screen")
-
-        if display_stats == True:
-            # find more info
-            played_all_time = lastfm_user_data.playcount(requested_username, "") + " all time"
-            played_this_year = lastfm_user_data.playcount(requested_username, "this_year") + " this year"
-            played_this_month = lastfm_user_data.playcount(requested_username, "this_month") + " this month"
-            played_this_week = lastfm_user_data.playcount(requested_username, "this_week") + " this week"
-            played_today = lastfm_user_data.playcount(requested_username, "today") + " today"
-        
-        if display_stats == True:
-            # print to the ink
-            ink_printer.print_text_to_ink (lastplayed_track, lastplayed_artist, lastplayed_album, played_all_time, played_this_year, played_this_month, played_this_week, played_today)
-
-        if display_stats == False:
-            #print to the ink
-            ink_printer.print_text_to_ink (lastplayed_track, lastplayed_artist, lastplayed_album)
-
-        # keep a record of the previous track name to see if it changes next time
-        previous_track_name = lastplayed_track
-
-    print ("Waiting " + str(frequency) + " seconds")
-    time.sleep (frequency)
+
+loop = asyncio.get_event_loop()
+try:
+    loop.run_until_complete(main(requested_username))
+except KeyboardInterrupt:
+    pass
+finally:
+    loop.close()
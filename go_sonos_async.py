@@ -0,0 +1,226 @@
+"""
+This file is for use with the Pimoroni inky wHAT display
+it integrates with your local Sonos sytem to display what is currently playing,
+receiving webhook updates from `node-sonos-http-api` like go_sonos_highres.py
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import signal
+import sys
+import time
+
+from aiohttp import ClientError, ClientSession, ClientTimeout
+
+import async_demaster
+import ink_printer
+from loop_monitor import DEFAULT_THRESHOLD, LoopMonitor
+from room_registry import RoomRegistry
+from webhook_handler import SonosWebhook
+
+_LOGGER = logging.getLogger(__name__)
+
+try:
+    import sonos_settings
+except ImportError:
+    _LOGGER.error("ERROR: Config file not found. Copy 'sonos_settings.py.example' to 'sonos_settings.py' before you edit. You can do this with the command: cp sonos_settings.py.example sonos_settings.py")
+    sys.exit(1)
+
+###############################################################################
+# Global variables and setup
+if getattr(sonos_settings, "pi_zero", False):
+    POLLING_INTERVAL = 1
+    SLEEP_DELAY = 20
+else:
+    POLLING_INTERVAL = 0.5
+    SLEEP_DELAY = 5
+WEBHOOK_INTERVAL = 60
+
+SLEEP_MODE_OUTPUT = "logo"  # can also be "blank"
+SLEEP_LOGO = os.path.join(sys.path[0], "sonos-inky.png")
+
+API_READY_TIMEOUT = 120
+API_PROBE_INTERVAL = 0.5
+API_PROBE_MAX_INTERVAL = 5
+API_PROBE_TIMEOUT = ClientTimeout(total=5)
+
+###############################################################################
+# Functions
+
+class InkyScreen():
+    """Run the blocking Inky refreshes one at a time on a worker thread."""
+
+    def __init__(self, loop):
+        """Initialize the screen."""
+        self.loop = loop
+        self.sleeping = False
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._sleep_handle = None
+
+    async def _run(self, func, *args):
+        """Run an ink_printer function without blocking the event loop."""
+        await self.loop.run_in_executor(self._executor, func, *args)
+
+    async def show_track(self, track, artist, album):
+        """Print the track to the screen, waking it up if needed."""
+        self.cancel_sleep()
+        self.sleeping = False
+        await self._run(ink_printer.print_text_to_ink, track, artist, album)
+
+    def schedule_sleep(self):
+        """Put the screen to sleep if nothing starts playing within SLEEP_DELAY seconds."""
+        if self.sleeping or self._sleep_handle:
+            return
+        self._sleep_handle = self.loop.call_later(
+            SLEEP_DELAY, lambda: asyncio.ensure_future(self._sleep()))
+
+    def cancel_sleep(self):
+        """Cancel a pending sleep, e.g. after a momentary pause."""
+        if self._sleep_handle:
+            self._sleep_handle.cancel()
+            self._sleep_handle = None
+
+    async def _sleep(self):
+        """Show the sleep screen."""
+        self._sleep_handle = None
+        self.sleeping = True
+        _LOGGER.info("Nothing playing, sleep mode")
+        if SLEEP_MODE_OUTPUT == "logo":
+            await self._run(ink_printer.show_image, SLEEP_LOGO)
+        else:
+            await self._run(ink_printer.blank_screen)
+
+    def cleanup(self):
+        """Stop the worker thread."""
+        self.cancel_sleep()
+        self._executor.shutdown(wait=False)
+
+
+def track_text(sonos_data):
+    """Return the (track, artist, album) lines to print for the current media."""
+    if sonos_data.type == "radio" and not sonos_data.trackname:
+        return sonos_data.station, "", ""
+    return sonos_data.trackname, sonos_data.artist, sonos_data.album
+
+
+async def redraw(session, sonos_data, screen):
+    """Redraw the screen with current data."""
+    if sonos_data.status != "PLAYING":
+        # ... but this may just be a momentary pause
+        screen.schedule_sleep()
+        return
+
+    screen.cancel_sleep()
+    if not sonos_data.is_track_new() and not screen.sleeping:
+        return
+
+    track, artist, album = track_text(sonos_data)
+
+    # demaster the track name if set to do so
+    if sonos_settings.demaster and sonos_data.type not in ["line_in", "TV"]:
+        offline = not getattr(sonos_settings, "demaster_query_cloud", False)
+        track, = await async_demaster.strip_names([track], session, offline)
+
+    _LOGGER.info("Printing: %s", track)
+    await screen.show_track(track, artist, album)
+
+
+async def wait_for_api(session, timeout=API_READY_TIMEOUT):
+    """Wait until `node-sonos-http-api` answers, returning True if it became ready."""
+    url = f"http://{sonos_settings.sonos_http_api_address}:{sonos_settings.sonos_http_api_port}/zones"
+    deadline = time.monotonic() + timeout
+    delay = API_PROBE_INTERVAL
+    while True:
+        try:
+            async with session.get(url, timeout=API_PROBE_TIMEOUT) as response:
+                if response.status == 200:
+                    _LOGGER.info("node-sonos-http-api is ready")
+                    return True
+                _LOGGER.debug("node-sonos-http-api not ready: HTTP %s", response.status)
+        except (ClientError, asyncio.TimeoutError) as err:
+            _LOGGER.debug("node-sonos-http-api not ready: %s", err)
+
+        if time.monotonic() + delay > deadline:
+            _LOGGER.warning("node-sonos-http-api not ready after %s seconds, continuing anyway", timeout)
+            return False
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, API_PROBE_MAX_INTERVAL)
+
+
+async def main(loop):
+    """Main process for script."""
+    log_level = getattr(sonos_settings, "log_level", logging.INFO)
+    logging.basicConfig(format="%(asctime)s %(levelname)7s - %(message)s", level=log_level)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+    # check if a command line argument has been passed to identify the room, if not ask
+    if len(sys.argv) == 1:
+        sonos_room = input("Enter a Sonos room name >>>  ")
+    else:
+        sonos_room = str(sys.argv[1])
+
+    async_demaster.configure_cache(getattr(sonos_settings, "demaster_cache_file", None))
+
+    frame_export_file = getattr(sonos_settings, "frame_export_file", None)
+    if frame_export_file:
+        ink_printer.export_frames(frame_export_file)
+
+    monitor = LoopMonitor(loop, getattr(sonos_settings, "loop_block_threshold_ms", DEFAULT_THRESHOLD * 1000) / 1000)
+    monitor.start()
+
+    session = ClientSession()
+    await wait_for_api(session)
+
+    registry = RoomRegistry(
+        sonos_settings.sonos_http_api_address,
+        sonos_settings.sonos_http_api_port,
+        session,
+    )
+    screen = InkyScreen(loop)
+
+    async def display_callback(sonos_data):
+        """Callback to trigger after the displayed room is updated."""
+        await redraw(session, sonos_data, screen)
+
+    registry.subscribe(sonos_room, display_callback)
+
+    webhook = SonosWebhook(None, registry, sonos_room)
+    webhook.add_status_provider("demaster", async_demaster.cache_stats)
+    webhook.add_status_provider("polling", registry.polling_stats)
+    webhook.add_status_provider("event_loop", monitor.stats)
+    if ink_printer.frame_exporter:
+        webhook.set_frame_source(ink_printer.frame_exporter)
+        webhook.add_status_provider("frame_export", ink_printer.frame_exporter.stats)
+    await webhook.listen()
+
+    for signame in ('SIGINT', 'SIGTERM', 'SIGQUIT'):
+        loop.add_signal_handler(getattr(signal, signame), lambda: asyncio.ensure_future(
+            cleanup(loop, session, webhook, screen, registry, monitor)))
+
+    registry.start_polling(POLLING_INTERVAL, WEBHOOK_INTERVAL)
+
+
+async def cleanup(loop, session, webhook, screen, registry, monitor=None):
+    """Cleanup tasks on shutdown."""
+    _LOGGER.debug("Shutting down")
+    if monitor:
+        monitor.stop()
+    registry.stop_polling()
+    screen.cleanup()
+    await async_demaster.save_cache()
+    await session.close()
+    await webhook.stop()
+
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    [task.cancel() for task in tasks]
+    await asyncio.gather(*tasks, return_exceptions=True)
+    loop.stop()
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    try:
+        loop.create_task(main(loop))
+        loop.run_forever()
+    finally:
+        loop.close()
@@ -5,19 +5,27 @@ it integrates with your local Sonos sytem to display what is currently playing
 import asyncio
 import logging
 import os
-import re
 import signal
 import subprocess
 import sys
-import time
-from io import BytesIO
 
 from aiohttp import ClientError, ClientSession
 from PIL import Image, ImageFile
 
 import async_demaster
-from display_controller import DisplayController, SonosDisplaySetupError
-from sonos_user_data import SonosData
+from capture import PayloadRecorder
+from display_controller import DEFAULT_FRAME_RATE, DisplayController
+from frame_export import DEFAULT_SLOTS, FrameExporter
+from hyperpixel_backlight import Backlight
+from image_cache import DEFAULT_CACHE_DIR, ImageCache
+from image_ingest import ImageTooLarge, decode_image, ingest_stats, read_image_data
+from loop_monitor import DEFAULT_THRESHOLD, LoopMonitor
+from metrics import LatencyMetrics, mark
+from prefetch import ArtworkPrefetcher
+from render_backend import PILDisplay, SonosDisplaySetupError, open_target
+from render_pipeline import RenderPipeline
+from room_registry import RoomRegistry
+from spotify_client import SpotifyLookup, spotify_code_url
 from webhook_handler import SonosWebhook
 
 _LOGGER = logging.getLogger(__name__)
@@ -31,15 +39,6 @@ except ImportError:
 show_spotify_code = getattr(sonos_settings, "show_spotify_code", None)
 show_spotify_albumart = getattr(sonos_settings, "show_spotify_albumart", None)
 
-if show_spotify_code or show_spotify_albumart:
-    try:
-        import spotipy
-        from spotipy.oauth2 import SpotifyClientCredentials
-        spotify_import_success = True
-    except ImportError:
-        _LOGGER.error("ERROR: spotipy not found. Install spotipy with the command: pip install spotipy")
-        sys.exit(1)
-
 ###############################################################################
 # Global variables and setup
 POLLING_INTERVAL = 1
@@ -50,11 +49,16 @@ ImageFile.LOAD_TRUNCATED_IMAGES = True
 ###############################################################################
 # Functions
 
-async def get_image_data(session, url):
+async def get_image_data(session, url, image_cache=None):
     """Return image data from a URL if available."""
     if not url:
         return None
 
+    if image_cache:
+        data = await image_cache.get(url)
+        if data:
+            return data
+
     try:
         async with session.get(url) as response:
             content_type = response.headers.get('content-type')
@@ -62,26 +66,105 @@ async def get_image_data(session, url):
                 _LOGGER.warning(
                     "Not a valid image type (%s): %s", content_type, url)
                 return None
-            return await response.read()
+            data = await read_image_data(response)
+    except ImageTooLarge as err:
+        _LOGGER.warning("Image too large, skipped: %s [%s]", url, err)
+        return None
     except ClientError as err:
         _LOGGER.warning("Problem connecting to %s [%s]", url, err)
+        return None
     except Exception as err:
         _LOGGER.warning("Image failed to load: %s [%s]", url, err)
-    return None
+        return None
 
+    if image_cache:
+        await image_cache.put(url, data)
+    return data
+
+
+async def get_artwork(session, url, image_cache=None, prefetcher=None):
+    """Return a prefetched image or raw image data for a URL."""
+    if not url:
+        return None
+
+    if prefetcher:
+        image = prefetcher.take_image(url)
+        if image is not None:
+            return image
+
+    return await get_image_data(session, url, image_cache)
 
-async def redraw(session, sonos_data, display):
-    """Redraw the screen with current data."""
-    if sonos_data.status == "API error":
-        return
 
-    pil_image = None
-    code_image = None
-    spotify_code_uri = None
+def open_image(source, size=None):
+    """Return a PIL image from a prefetched image or raw image data, decoding JPEGs no larger than needed for `size`."""
+    if source is None or isinstance(source, Image.Image):
+        return source
+    try:
+        return decode_image(source, size)
+    except ImageTooLarge as err:
+        _LOGGER.warning("Image too large to decode [%s]", err)
+        return None
+
+
+async def fetch_artwork(session, track, spotify=None, image_cache=None, prefetcher=None):
+    """Retrieve the Spotify Code and album art for a track, returning (code, album art) sources."""
+    code_source = None
     spotify_albumart_uri = None
-    spotify_client_id = None
-    spotify_client_secret = None
-    spotify_auth_success = False 
+
+    if track.artist != "" and track.trackname !="":
+        if show_spotify_code or show_spotify_albumart:
+            if spotify:
+                spotify_code_uri, spotify_albumart_uri = await spotify.lookup(track.artist, track.trackname, track.uri)
+
+                code_source = await get_artwork(session, spotify_code_url(spotify_code_uri), image_cache, prefetcher)
+
+                if code_source == None:
+                        _LOGGER.info("Spotify Code not available")
+                if spotify_albumart_uri == None:
+                        _LOGGER.info("Spotify album art not available")
+            else:
+                _LOGGER.warning("No Spotify API client ID or Secret in settings file, cannot search the Spotify API")
+    else:
+        _LOGGER.debug("Either artist and/or trackname was blank, skipped searching Spotify")
+    mark(track, "spotify")
+
+    if show_spotify_albumart and spotify_albumart_uri != None:
+        image_source = await get_artwork(session, spotify_albumart_uri, image_cache, prefetcher)
+    else:
+        image_source = await get_artwork(session, track.image_uri, image_cache, prefetcher)
+    mark(track, "artwork")
+
+    return code_source, image_source
+
+
+def prepare_frame(display, track, artwork):
+    """Decode and resize the artwork for a track. Runs in the render worker pool."""
+    code_source, image_source = artwork
+    code_image = open_image(code_source)
+    pil_image = open_image(image_source, display.SCREEN_W)
+
+    if pil_image is None and track.type == "line_in":
+        pil_image = Image.open(sys.path[0] + "/line_in.png")
+    elif pil_image is None and track.type == "TV":
+        pil_image = Image.open(sys.path[0] + "/tv.png")
+
+    if pil_image is None:
+        if show_spotify_code or show_spotify_albumart:
+            pil_image = Image.open(sys.path[0] + "/spotify_sonos.png")
+        else:
+            pil_image = Image.open(sys.path[0] + "/sonos.png")
+        _LOGGER.warning("Image not available, using default")
+    mark(track, "decode")
+
+    frame = display.prepare(code_image, pil_image, track)
+    mark(track, "resize")
+    return frame
+
+
+async def redraw(session, sonos_data, display, pipeline, prefetcher=None, metrics=None):
+    """Redraw the screen with current data, tracing track changes in `metrics` if given."""
+    if sonos_data.status == "API error":
+        return
 
     def should_sleep():
         """Determine if screen should be sleeping."""
@@ -91,6 +174,7 @@ async def redraw(session, sonos_data, display):
             return getattr(sonos_settings, "sleep_on_tv", False)
 
     if should_sleep():
+        pipeline.cancel()
         if display.is_showing:
             _LOGGER.debug("Input source is %s, sleeping", sonos_data.type)
             display.hide_album()
@@ -108,107 +192,37 @@ async def redraw(session, sonos_data, display):
                 force_update = True
                 display.show_album()
 
-        # slim down the album and track names
-        if sonos_settings.demaster and sonos_data.type not in ["line_in", "TV"]:
+        trace = None
+        if metrics and (new_track_info or force_update):
+            trace = metrics.begin(sonos_data.previous_track, sonos_data.refresh_source, sonos_data.refresh_started)
+            trace.mark("refresh")
+
+        # slim down the album and track names, keeping the raw ones for comparing polls
+        if new_track_info and sonos_settings.demaster and sonos_data.type not in ["line_in", "TV"]:
             offline = not getattr(
                 sonos_settings, "demaster_query_cloud", False)
-            sonos_data.trackname = await async_demaster.strip_name(sonos_data.trackname, session, offline)
-            sonos_data.album = await async_demaster.strip_name(sonos_data.album, session, offline)
+            sonos_data.set_clean_names(*await async_demaster.strip_names(
+                [sonos_data.trackname, sonos_data.album], session, offline))
+        if trace:
+            trace.mark("demaster")
+
+        play_state_changed = sonos_data.is_play_state_new()
 
         if new_track_info or force_update:
             _LOGGER.debug("The new_track_info state is %s and force_update state is %s, resetting display with new information", new_track_info, force_update)
-
-            if sonos_data.artist != "" and sonos_data.trackname !="":
-                if show_spotify_code or show_spotify_albumart:
-                    spotify_client_id = getattr(sonos_settings, "spotify_client_id", None)
-                    spotify_client_secret = getattr(sonos_settings, "spotify_client_secret", None)
-
-                    if spotify_client_id and spotify_client_secret:
-                        client_credentials_manager = SpotifyClientCredentials(spotify_client_id, spotify_client_secret)
-                        try:
-                            spotify_auth_success = True
-                            spotify = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
-                            _LOGGER.debug("Authorising Spotify developer account successful")
-                        except:
-                            spotify_auth_success = False
-                            _LOGGER.warning("Problem authorising Spotify developer account, please check your credentials in sonos_settings.py are correct")
-                    else:
-                        spotify_auth_success = False
-
-                if spotify_client_id and spotify_client_secret:
-                    if show_spotify_code or show_spotify_albumart and spotify_auth_success:
-                        spotify_code_path = "https://scannables.scdn.co/uri/plain/png/368A7D/white/320/"
-
-                        try:
-                            results = spotify.search(q="artist:" + re.sub("´|`|'|’", "", sonos_data.artist) + " track:" + re.sub("´|`|'|’", "", sonos_data.trackname), type="track", limit=1, market=sonos_settings.spotify_market)
-
-                            if results['tracks']['total'] != 0:
-                                results = results['tracks']['items'][0]  # Find top result
-                                uri = results['uri']
-                                spotify_albumart_uri = results['album']['images'][0]['url']
-                                _LOGGER.debug("Spotify album art URI successfully obtained: %s", spotify_albumart_uri)
-                                if sonos_data.uri.startswith('x-sonos-spotify:'):
-                                    spotify_code_uri = sonos_data.uri.replace('x-sonos-spotify:', '')
-                                else:                            
-                                    spotify_code_uri = uri
-                                _LOGGER.debug("Spotify Code URI successfully obtained: %s", spotify_code_uri)
-                            else:
-                                spotify_code_uri = None
-                                spotify_albumart_uri = None
-                        except:
-                            spotify_code_uri = None
-                            spotify_albumart_uri = None
-                            _LOGGER.warning("Problem searching Spotify, defaulting to Sonos system")
-
-                        if spotify_code_uri != None:
-                            spotify_code_url = "".join(filter(None, [spotify_code_path, spotify_code_uri]))
-                        else:
-                            spotify_code_url = None
-
-                        if spotify_code_url != None:
-                            code_data = await get_image_data(session, spotify_code_url)
-                            if code_data:
-                                code_image = Image.open(BytesIO(code_data))
-                            else:
-                                code_image = None
-                        else:
-                            code_image = None
-
-                        if code_image == None:
-                                _LOGGER.info("Spotify Code not available")
-                        if spotify_albumart_uri == None:
-                                _LOGGER.info("Spotify album art not available")
-                    else:
-                        code_image = None
-                else:
-                    if show_spotify_code or show_spotify_albumart:
-                        _LOGGER.warning("No Spotify API client ID or Secret in settings file, cannot search the Spotify API")
-            else:
-                _LOGGER.debug("Either artist and/or trackname was blank, skipped searching Spotify")
-
-            if show_spotify_albumart and spotify_auth_success and spotify_albumart_uri != None:
-                image_data = await get_image_data(session, spotify_albumart_uri)
-            else:
-                image_data = await get_image_data(session, sonos_data.image_uri)
-            
-            if image_data:
-                pil_image = Image.open(BytesIO(image_data))
-            elif sonos_data.type == "line_in":
-                pil_image = Image.open(sys.path[0] + "/line_in.png")
-            elif sonos_data.type == "TV":
-                pil_image = Image.open(sys.path[0] + "/tv.png")
-
-            if pil_image is None:
-                if show_spotify_code or show_spotify_albumart:
-                    pil_image = Image.open(sys.path[0] + "/spotify_sonos.png")
-                else:
-                    pil_image = Image.open(sys.path[0] + "/sonos.png")
-                _LOGGER.warning("Image not available, using default")
-
-            display.update(code_image, pil_image, sonos_data)
+            track = sonos_data.snapshot()
+            track.trace = trace
+            pipeline.submit(track)
+        elif play_state_changed:
+            _LOGGER.debug("Play state changed, updating play state only")
+            display.update_play_state(sonos_data.snapshot())
         else:
             _LOGGER.debug("The new_track_info state is %s, no action taken", new_track_info)
+
+        if prefetcher:
+            prefetcher.schedule(sonos_data)
     else:
+        pipeline.cancel()
         display.hide_album()
 
 
@@ -269,15 +283,30 @@ async def main(loop):
         sonos_settings, "show_details_timeout", None)
     overlay_text = getattr(sonos_settings, "overlay_text", None)
     show_play_state = getattr(sonos_settings, "show_play_state", None)
-    
+    render_cache_size = getattr(sonos_settings, "render_cache_size_mb", 16) * 1024 * 1024
+
+    display_backend = getattr(sonos_settings, "display_backend", "tk")
+    display_options = (loop, sonos_settings.show_details, sonos_settings.show_artist_and_album,
+                       show_details_timeout, overlay_text, show_play_state, show_spotify_code,
+                       render_cache_size)
 
     try:
-        display = DisplayController(loop, sonos_settings.show_details, sonos_settings.show_artist_and_album,
-                                    show_details_timeout, overlay_text, show_play_state, show_spotify_code)
+        if display_backend == "tk":
+            display = DisplayController(*display_options, frame_rate=getattr(sonos_settings, "display_frame_rate", DEFAULT_FRAME_RATE))
+        else:
+            target = open_target(display_backend, getattr(sonos_settings, "display_backend_path", None))
+            backlight = Backlight() if display_backend == "framebuffer" else None
+            display = PILDisplay(target, *display_options, backlight=backlight)
     except SonosDisplaySetupError:
         loop.stop()
         return
 
+    exporter = None
+    frame_export_file = getattr(sonos_settings, "frame_export_file", None)
+    if frame_export_file:
+        exporter = FrameExporter(frame_export_file, getattr(sonos_settings, "frame_export_slots", DEFAULT_SLOTS))
+        display.exporter = exporter
+
     if sonos_settings.room_name_for_highres == "":
         print("No room name found in sonos_settings.py")
         print("You can specify a room name manually below")
@@ -287,43 +316,144 @@ async def main(loop):
         sonos_room = input("Enter a Sonos room name for testing purposes>>>  ")
     else:
         sonos_room = sonos_settings.room_name_for_highres
-        _LOGGER.info("Monitoring room: %s", sonos_room)
+
+    image_cache = None
+    if getattr(sonos_settings, "album_art_cache", True):
+        image_cache = ImageCache(
+            getattr(sonos_settings, "album_art_cache_dir", DEFAULT_CACHE_DIR),
+            getattr(sonos_settings, "album_art_cache_size_mb", 50) * 1024 * 1024,
+        )
+
+    async_demaster.configure_cache(getattr(sonos_settings, "demaster_cache_file", None))
+
+    loop_block_threshold_ms = getattr(sonos_settings, "loop_block_threshold_ms", DEFAULT_THRESHOLD * 1000)
+    monitor = LoopMonitor(loop, loop_block_threshold_ms / 1000)
+    monitor.start()
+
+    slow_track_change_ms = getattr(sonos_settings, "slow_track_change_ms", None)
+    metrics = LatencyMetrics(slow_track_change_ms / 1000 if slow_track_change_ms else None)
+
+    recorder = None
+    capture_file = getattr(sonos_settings, "capture_file", None)
+    if capture_file:
+        recorder = PayloadRecorder(capture_file)
 
     session = ClientSession()
-    sonos_data = SonosData(
+    registry = RoomRegistry(
         sonos_settings.sonos_http_api_address,
         sonos_settings.sonos_http_api_port,
-        sonos_room,
         session,
+        recorder,
     )
-
-    async def webhook_callback():
-        """Callback to trigger after webhook is processed."""
-        await redraw(session, sonos_data, display)
-
-    webhook = SonosWebhook(display, sonos_data, webhook_callback)
+    registry.add_room(sonos_room)
+    for room in getattr(sonos_settings, "monitor_rooms", []):
+        registry.add_room(room, persistent=True)
+
+    spotify = None
+    if show_spotify_code or show_spotify_albumart:
+        spotify_client_id = getattr(sonos_settings, "spotify_client_id", None)
+        spotify_client_secret = getattr(sonos_settings, "spotify_client_secret", None)
+        if spotify_client_id and spotify_client_secret:
+            spotify = SpotifyLookup(
+                session, spotify_client_id, spotify_client_secret,
+                getattr(sonos_settings, "spotify_market", None))
+
+    prefetcher = None
+    if getattr(sonos_settings, "prefetch_next_track", True):
+        async def fetch_image(url):
+            """Fetch image data through the shared session and cache."""
+            return await get_image_data(session, url, image_cache)
+
+        clean_names = None
+        if sonos_settings.demaster:
+            offline = not getattr(sonos_settings, "demaster_query_cloud", False)
+
+            async def clean_names(names):
+                """Demaster names the same way redraw() does."""
+                return await async_demaster.strip_names(names, session, offline)
+
+        spotify_lookup = None
+        if spotify:
+            spotify_lookup = spotify.lookup
+
+        prefetcher = ArtworkPrefetcher(display, fetch_image, clean_names, spotify_lookup, show_spotify_albumart)
+
+    async def fetch(track):
+        """Fetch stage of the render pipeline."""
+        return await fetch_artwork(session, track, spotify, image_cache, prefetcher)
+
+    def prepare(track, artwork):
+        """Prepare stage of the render pipeline."""
+        frame = prepare_frame(display, track, artwork)
+        frame.trace = track.trace
+        return frame
+
+    def apply(frame):
+        """Apply stage of the render pipeline, completing the track change trace."""
+        display.apply(frame)
+        if frame.trace:
+            frame.trace.mark("apply")
+            metrics.finish(frame.trace)
+
+    pipeline = RenderPipeline(fetch, prepare, apply)
+    pipeline.start()
+    display.executor = pipeline.executor
+
+    async def display_callback(sonos_data):
+        """Callback to trigger after the displayed room is updated."""
+        await redraw(session, sonos_data, display, pipeline, prefetcher, metrics)
+
+    registry.subscribe(sonos_room, display_callback)
+
+    webhook = SonosWebhook(display, registry, sonos_room)
+    if image_cache:
+        webhook.add_status_provider("image_cache", image_cache.stats)
+    webhook.add_status_provider("image_ingest", ingest_stats)
+    webhook.add_status_provider("render_cache", display.resize_cache.stats)
+    webhook.add_status_provider("render_pipeline", pipeline.stats)
+    webhook.add_status_provider("display", display.stats)
+    webhook.add_status_provider("demaster", async_demaster.cache_stats)
+    webhook.add_status_provider("polling", registry.polling_stats)
+    if prefetcher:
+        webhook.add_status_provider("prefetch", prefetcher.stats)
+    if spotify:
+        webhook.add_status_provider("spotify", spotify.stats)
+    if recorder:
+        webhook.add_status_provider("capture", recorder.stats)
+    if exporter:
+        webhook.set_frame_source(exporter)
+        webhook.add_status_provider("frame_export", exporter.stats)
+    webhook.add_status_provider("track_change", metrics.stats)
+    webhook.add_status_provider("event_loop", monitor.stats)
+    metrics.add_counters("event_loop", monitor.stats)
+    metrics.add_counters("render_pipeline", pipeline.stats)
+    metrics.add_counters("render_cache", display.resize_cache.stats)
+    metrics.add_counters("image_ingest", ingest_stats)
+    webhook.set_metrics(metrics)
     await webhook.listen()
 
     for signame in ('SIGINT', 'SIGTERM', 'SIGQUIT'):
         loop.add_signal_handler(getattr(signal, signame), lambda: asyncio.ensure_future(
-            cleanup(loop, session, webhook, display)))
-
-    while True:
-        if sonos_data.webhook_active:
-            update_interval = WEBHOOK_INTERVAL
-        else:
-            update_interval = POLLING_INTERVAL
+            cleanup(loop, session, webhook, display, pipeline, registry, image_cache, recorder, exporter, monitor)))
 
-        if time.time() - sonos_data.last_update > update_interval:
-            await sonos_data.refresh()
-            await redraw(session, sonos_data, display)
-        await asyncio.sleep(1)
+    registry.start_polling(POLLING_INTERVAL, WEBHOOK_INTERVAL)
 
 
-async def cleanup(loop, session, webhook, display):
+async def cleanup(loop, session, webhook, display, pipeline, registry, image_cache=None, recorder=None, exporter=None, monitor=None):
     """Cleanup tasks on shutdown."""
     _LOGGER.debug("Shutting down")
+    if monitor:
+        monitor.stop()
+    registry.stop_polling()
+    await pipeline.stop()
     display.cleanup()
+    if image_cache:
+        await image_cache.flush()
+    if recorder:
+        recorder.close()
+    await async_demaster.save_cache()
+    if exporter:
+        exporter.close()
     await session.close()
     await webhook.stop()
 
@@ -0,0 +1,224 @@
+"""
+Persistent on-disk cache for album art downloaded by the high-res display.
+Image data is stored once per content hash and looked up by normalized URI.
+"""
+import asyncio
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "~/.cache/music-screen-api/album_art"
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+INDEX_FILE = "index.json"
+SAVE_DELAY = 30
+
+
+def normalize_uri(uri):
+    """Return a stable cache key for an image URI."""
+    parts = urlsplit(uri.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    if parts.path == "/getaa":
+        # Every speaker in a group serves the same art from its own address
+        return urlunsplit(("", "", parts.path, query, ""))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+
+class ImageCache():
+    """Size-bounded LRU cache of image data keyed by URI and content hash."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """Initialize the cache and load any existing index from disk."""
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.active = True
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_served = 0
+        self.bytes_stored = 0
+        self._uris = {}
+        self._objects = OrderedDict()
+        self._total_bytes = 0
+        self._dirty = False
+        self._save_handle = None
+        self._save_lock = None
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        except OSError as err:
+            self.active = False
+            _LOGGER.error("Album art cache disabled, cannot create %s [%s]", self.cache_dir, err)
+            return
+
+        self._load_index()
+
+    def _object_path(self, content_hash):
+        """Return the file path for a content hash."""
+        return os.path.join(self.cache_dir, f"{content_hash}.img")
+
+    def _load_index(self):
+        """Restore the URI map and LRU order saved by a previous run."""
+        index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        try:
+            with open(index_path, encoding="utf-8") as index_file:
+                index = json.load(index_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as err:
+            _LOGGER.warning("Album art cache index unreadable, starting empty [%s]", err)
+            return
+
+        for content_hash, size in index.get("objects", []):
+            if os.path.isfile(self._object_path(content_hash)):
+                self._objects[content_hash] = size
+                self._total_bytes += size
+        self._uris = {
+            key: content_hash
+            for key, content_hash in index.get("uris", {}).items()
+            if content_hash in self._objects
+        }
+        _LOGGER.debug("Loaded %s cached images (%s bytes)", len(self._objects), self._total_bytes)
+
+    def _save(self, index):
+        """Write an index snapshot to disk. Blocking."""
+        index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        try:
+            with open(f"{index_path}.tmp", "w", encoding="utf-8") as index_file:
+                json.dump(index, index_file)
+            os.replace(f"{index_path}.tmp", index_path)
+        except OSError as err:
+            _LOGGER.warning("Unable to save album art cache index [%s]", err)
+
+    def _schedule_save(self):
+        """Save the index after a delay, writing once for all changes made meanwhile."""
+        self._dirty = True
+        if self._save_handle is None:
+            self._save_handle = asyncio.get_running_loop().call_later(
+                SAVE_DELAY, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Persist the URI map and LRU order to disk in an executor if they changed."""
+        if self._save_handle:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self._save_lock is None:
+            self._save_lock = asyncio.Lock()
+
+        async with self._save_lock:
+            if not self.active or not self._dirty:
+                return
+            self._dirty = False
+            index = {
+                "uris": dict(self._uris),
+                "objects": list(self._objects.items()),
+            }
+            await asyncio.get_running_loop().run_in_executor(None, self._save, index)
+
+    def _read_object(self, content_hash):
+        """Read image data from its object file. Blocking."""
+        with open(self._object_path(content_hash), "rb") as image_file:
+            return image_file.read()
+
+    async def get(self, uri):
+        """Return cached image data for a URI or None, reading it in an executor."""
+        if not self.active or not uri:
+            return None
+
+        content_hash = self._uris.get(normalize_uri(uri))
+        if content_hash is None:
+            self.misses += 1
+            return None
+
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(None, self._read_object, content_hash)
+        except OSError:
+            self._forget(content_hash)
+            self.misses += 1
+            return None
+
+        # May have been evicted while reading
+        if content_hash in self._objects:
+            self._objects.move_to_end(content_hash)
+        self.hits += 1
+        self.bytes_served += len(data)
+        return data
+
+    def _write_object(self, content_hash, data):
+        """Write image data to its object file. Blocking."""
+        with open(self._object_path(content_hash), "wb") as image_file:
+            image_file.write(data)
+
+    def _remove_objects(self, content_hashes):
+        """Delete evicted object files. Blocking."""
+        for content_hash in content_hashes:
+            try:
+                os.remove(self._object_path(content_hash))
+            except OSError:
+                pass
+
+    async def put(self, uri, data):
+        """Store image data for a URI, evicting old entries if needed."""
+        if not self.active or not uri or not data:
+            return
+
+        size = len(data)
+        if size > self.max_bytes:
+            return
+
+        loop = asyncio.get_running_loop()
+        content_hash = hashlib.sha1(data).hexdigest()
+        if content_hash in self._objects:
+            self._objects.move_to_end(content_hash)
+        else:
+            try:
+                await loop.run_in_executor(None, self._write_object, content_hash, data)
+            except OSError as err:
+                _LOGGER.warning("Unable to write to album art cache [%s]", err)
+                return
+            if content_hash not in self._objects:
+                self._objects[content_hash] = size
+                self._total_bytes += size
+                self.bytes_stored += size
+
+        self._uris[normalize_uri(uri)] = content_hash
+        evicted = self._evict()
+        self._schedule_save()
+        if evicted:
+            await loop.run_in_executor(None, self._remove_objects, evicted)
+
+    def _evict(self):
+        """Drop least recently used images from the index until under the size limit, returning their hashes."""
+        evicted = []
+        while self._total_bytes > self.max_bytes and self._objects:
+            content_hash = next(iter(self._objects))
+            self._forget(content_hash)
+            self.evictions += 1
+            evicted.append(content_hash)
+        return evicted
+
+    def _forget(self, content_hash):
+        """Drop an image and every URI pointing to it from the index."""
+        self._total_bytes -= self._objects.pop(content_hash, 0)
+        self._uris = {
+            key: value for key, value in self._uris.items() if value != content_hash
+        }
+
+    def stats(self):
+        """Return cache counters for status reporting."""
+        return {
+            "active": self.active,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes_served": self.bytes_served,
+            "bytes_stored": self.bytes_stored,
+            "entries": len(self._uris),
+            "images": len(self._objects),
+            "size": self._total_bytes,
+            "max_size": self.max_bytes,
+        }
@@ -0,0 +1,72 @@
+"""
+Download and decode album art no larger than the display needs.
+
+Downloads are streamed with a size cap so oversized payloads are dropped
+before they are buffered or decoded. JPEGs are decoded in draft mode, letting
+libjpeg scale by 1/2, 1/4 or 1/8 while decoding to the smallest size still at
+least as large as the display, instead of decoding every pixel and
+downsampling afterwards.
+"""
+from io import BytesIO
+import logging
+
+from PIL import Image
+
+_LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_BYTES = 8 * 1024 * 1024
+MAX_IMAGE_PIXELS = 4096 * 4096
+
+stats = {"decoded": 0, "draft": 0, "rejected": 0, "decoded_pixels": 0, "source_pixels": 0}
+
+
+class ImageTooLarge(Exception):
+    """Image payload or dimensions over the limit."""
+
+
+async def read_image_data(response, max_bytes=MAX_IMAGE_BYTES):
+    """Return the body of an aiohttp response, raising ImageTooLarge as soon as it exceeds `max_bytes`."""
+    length = response.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise ImageTooLarge(f"{length} bytes")
+
+    data = bytearray()
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        data.extend(chunk)
+        if len(data) > max_bytes:
+            raise ImageTooLarge(f"over {max_bytes} bytes")
+    return bytes(data)
+
+
+def decode_image(data, size=None, max_pixels=MAX_IMAGE_PIXELS):
+    """Return a PIL image from image data, reduced while decoding if a JPEG larger than `size` square.
+
+    Raises ImageTooLarge if the image would still decode to more than `max_pixels`.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+    except Image.DecompressionBombError as err:
+        stats["rejected"] += 1
+        raise ImageTooLarge(err) from err
+    source_size = image.size
+    if size and image.format == "JPEG" and min(image.size) >= 2 * size:
+        image.draft(None, (size, size))
+        stats["draft"] += 1
+
+    if image.width * image.height > max_pixels:
+        stats["rejected"] += 1
+        raise ImageTooLarge(f"{source_size[0]}x{source_size[1]} pixels")
+
+    image.load()
+    stats["decoded"] += 1
+    stats["decoded_pixels"] += image.width * image.height
+    stats["source_pixels"] += source_size[0] * source_size[1]
+    if image.size != source_size:
+        _LOGGER.debug("Decoded %sx%s image at %sx%s", *source_size, *image.size)
+    return image
+
+
+def ingest_stats():
+    """Return decode statistics for status reporting."""
+    return dict(stats)
@@ -1,9 +1,13 @@
 from inky import InkyWHAT
-from PIL import Image, ImageFont, ImageDraw, ImageOps
+from PIL import Image, ImageDraw, ImageOps
 from font_source_serif_pro import SourceSerifProSemibold
 from font_source_sans_pro import SourceSansProSemibold
 from font_hanken_grotesk import HankenGroteskBold, HankenGroteskMedium
+from font_registry import prewarm_truetype, truetype
+from frame_export import DEFAULT_EXPORT_FILE, FrameExporter
 import argparse
+import hashlib
+import time
 
 # user variable settings
 rotate = 0  # this can only be 0 or 180 depending on whether you want it upside down or not
@@ -30,6 +34,11 @@ summary_fontsize_for_artist = 27
 summary_gap_between_artist_and_album = 20
 summary_fontsize_for_album = 27
 
+# load every font size used below once, rather than on every line written
+prewarm_truetype(SourceSansProSemibold, {detail_fontsize_for_track, detail_fontsize_for_artist, detail_fontsize_for_album,
+    detail_fontsize_for_gap_before_stats, detail_fontsize_for_stats, summary_fontsize_for_track,
+    summary_fontsize_for_artist, summary_fontsize_for_album})
+
 # Set up the correct display and scaling factors
 inky_display = InkyWHAT("black")
 inky_display.set_border(inky_display.BLACK)
@@ -46,12 +55,63 @@ else:
 display_width = inky_display.WIDTH
 display_height = inky_display.HEIGHT
 
+# blank canvases already filled with a background colour, copied for each new screen
+canvas_templates = {}
+
+# this function returns a new canvas filled with the given colour
+def new_canvas(colour):
+    template = canvas_templates.get(colour)
+    if template is None:
+        template = canvas_templates[colour] = Image.new("P", (display_width, display_height), colour)
+    return template.copy()
+
+# the hash of the frame currently on the panel, used to skip refreshes that would change nothing
+last_frame_hash = None
+
+# this function returns a hash of the pixels of a frame
+def frame_hash(img):
+    return hashlib.md5(img.mode.encode() + bytes(str(img.size), "ascii") + img.tobytes()).hexdigest()
+
+# optional export of every frame shown to a shared memory ring buffer, see frame_export.py
+frame_exporter = None
+frame_track_id = ""
+
+# the colours of the inky palette indexes (white, black, red) used to export frames as RGB
+panel_palette = (255, 255, 255, 0, 0, 0, 255, 0, 0) + (0, 0, 0) * 253
+
+# this function starts exporting frames shown on the panel
+def export_frames(path=None):
+    global frame_exporter
+    frame_exporter = FrameExporter(path or DEFAULT_EXPORT_FILE, max_frame_bytes=display_width * display_height * 3)
+
+# this function publishes a frame to the exporter, as it would look on the panel
+def export_frame(img):
+    rgb = img.copy()
+    rgb.putpalette(panel_palette)
+    frame_exporter.publish(rgb.convert("RGB"), frame_track_id)
+
+# this function refreshes the panel with a frame, unless it is already showing it
+def show_on_panel(img):
+    global last_frame_hash
+
+    img_hash = frame_hash(img)
+    if img_hash == last_frame_hash:
+        print ("Frame unchanged, skipping refresh")
+        return False
+
+    inky_display.set_image(img)
+    inky_display.show()
+    last_frame_hash = img_hash
+    if frame_exporter:
+        export_frame(img)
+    return True
+
 # this function prints a new line to the image
 def write_new_line(text_to_write, font_size, alignment = "center", reflow=False):
     global line_y
     
     # set font - you can change this to others defined at the top of the script if you like
-    font = ImageFont.truetype(SourceSansProSemibold, font_size)
+    font = truetype(SourceSansProSemibold, font_size)
 
     # work out the size of the text
     text_width, text_height = font.getsize(text_to_write)
@@ -72,7 +132,9 @@ def write_new_line(text_to_write, font_size, alignment = "center", reflow=False)
 
 def print_text_to_ink(track, artist, album, stat1 = "", stat2 = "", stat3 = "", stat4 = "", stat5 =""):
     global line_y
+    global frame_track_id
     line_y = 0
+    frame_track_id = artist + " - " + track if artist else track
 
     if (rotate is not 0) and (rotate is not 180):
         # quits out with error if you ignored the comment above
@@ -85,13 +147,10 @@ def print_text_to_ink(track, artist, album, stat1 = "", stat2 = "", stat3 = "",
     global img
     global draw
     
-    img = Image.new("P", (inky_display.WIDTH, inky_display.HEIGHT))
+    render_start = time.perf_counter()
+    img = new_canvas(background_colour)
     draw = ImageDraw.Draw(img)
 
-    for y in range(0, inky_display.HEIGHT):
-        for x in range(0, inky_display.WIDTH):
-            img.putpixel((x, y), background_colour)
-
     # work out if we are in detailed mode or summary mode based on whether we have been passed stat1 or not
     if stat1 is not "":
         # we are in detailed mode
@@ -111,7 +170,7 @@ def print_text_to_ink(track, artist, album, stat1 = "", stat2 = "", stat3 = "",
 
         # sometimes the track name is too long to show so we need to reflow it - work out how to do that here
         # set font for track
-        font = ImageFont.truetype(SourceSansProSemibold, summary_fontsize_for_track)
+        font = truetype(SourceSansProSemibold, summary_fontsize_for_track)
 
         # split the track into lines
         words = track.split (" ")
@@ -152,17 +211,18 @@ def print_text_to_ink(track, artist, album, stat1 = "", stat2 = "", stat3 = "",
     if rotate == 180:
         img = img.rotate(180)
 
+    print ("Rendered in " + str(round((time.perf_counter() - render_start) * 1000, 1)) + " ms")
+
     # display the image on the screen
-    
-    inky_display.set_image(img)
-    inky_display.show()
+    show_on_panel(img)
 
 def blank_screen():
+    global frame_track_id
     print ("Blank")   
+    frame_track_id = ""
     img = Image.new("P", (inky_display.WIDTH, inky_display.HEIGHT))
     draw = ImageDraw.Draw(img)
-    inky_display.set_image(img)
-    inky_display.show()
+    show_on_panel(img)
     line_y = 0
 
 def show_image(img_file):
@@ -202,7 +262,6 @@ def show_image(img_file):
     #img = ImageOps.invert(img)
 
     # Display the final image on Inky wHAT
-    inky_display.set_image(img)
-    inky_display.show()
+    show_on_panel(img)
 
 
@@ -20,34 +20,34 @@ def static_data(lastfm_username, json_field):
 
     return output
 
-def playcount(lastfm_username, period):
-    # build URL
-    url = "http://ws.audioscrobbler.com/2.0/?method=user.getrecenttracks&user=" + lastfm_username + "&api_key=" + lastfm_public_key
-
+# this function returns the start of a period as a datetime, or None for all time
+def period_start_time(period, time_now=None):
     # work out the time now
     start_time = None
-    time_now = datetime.now()
+    if time_now is None:
+        time_now = datetime.now()
+    midnight = time_now.replace(hour=0, minute=0, second=0, microsecond=0)
 
     # if passed an appropriate time period argument, then set time period
     if period == "today":
-        start_time = time_now.replace(hour=0, minute=0)
+        start_time = midnight
 
     if period == "this_month":
-        start_time = time_now.replace(day=1, hour=0, minute=0)
+        start_time = midnight.replace(day=1)
     
     if period == "this_year":
-        start_time = time_now.replace(month=1, day=1, hour=0, minute=0)
+        start_time = midnight.replace(month=1, day=1)
     
     if period == "this_week":
-        start_time = time_now.replace(hour=0, minute=0)
+        start_time = midnight
         start_time = start_time - timedelta(days=start_time.weekday())
 
     if period == "last30days":
-        start_time = time_now.replace(hour=0, minute=0)
+        start_time = midnight
         start_time = start_time - timedelta(days=30)
     
     if period == "last7days":
-        start_time = time_now.replace(hour=0, minute=0)
+        start_time = midnight
         start_time = start_time - timedelta(days=7)
 
     if period == "last24hours":
@@ -56,6 +56,14 @@ def playcount(lastfm_username, period):
     if period == "last_hour":
         start_time = time_now - timedelta(hours=1)
 
+    return start_time
+
+def playcount(lastfm_username, period):
+    # build URL
+    url = "http://ws.audioscrobbler.com/2.0/?method=user.getrecenttracks&user=" + lastfm_username + "&api_key=" + lastfm_public_key
+
+    start_time = period_start_time(period)
+
     # if start_time has been set then append it to the url
     if start_time is not None:
         start_timestamp = datetime.timestamp(start_time)
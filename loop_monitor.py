@@ -0,0 +1,124 @@
+"""
+Watchdog for callbacks blocking the event loop.
+
+A heartbeat scheduled on the loop measures how late it runs. A watchdog
+thread notices when the heartbeat is overdue by more than the threshold and
+captures the loop thread's stack and current task while the block is still
+happening, so the offending code is known rather than only the delay.
+"""
+import asyncio
+from collections import deque
+import logging
+import sys
+import threading
+import time
+
+from profiler import collapse
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.1
+HEARTBEAT_INTERVAL = 0.1
+LAG_WINDOW = 600
+MAX_BLOCKS = 20
+STACK_DEPTH = 12
+
+
+def running_handle(frame):
+    """Return the repr of the asyncio callback handle being run in a stack, if any."""
+    while frame is not None:
+        if frame.f_code is asyncio.Handle._run.__code__:  # pylint: disable=protected-access
+            return repr(frame.f_locals.get("self"))
+        frame = frame.f_back
+    return None
+
+
+class LoopMonitor():
+    """Measure event loop lag and record what blocked it."""
+
+    def __init__(self, loop, threshold=DEFAULT_THRESHOLD, interval=HEARTBEAT_INTERVAL):
+        """Initialize the monitor for a loop, recording blocks longer than `threshold` seconds."""
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.lags = deque(maxlen=LAG_WINDOW)
+        self.blocks = deque(maxlen=MAX_BLOCKS)
+        self.blocked = 0
+        self._due = None
+        self._handle = None
+        self._capture = None
+        self._loop_thread = None
+        self._stopped = threading.Event()
+        self._watchdog = None
+
+    def start(self):
+        """Start the heartbeat and watchdog. Must be called from the loop thread."""
+        self._loop_thread = threading.get_ident()
+        self._schedule()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        """Stop monitoring."""
+        self._stopped.set()
+        if self._handle:
+            self._handle.cancel()
+
+    def _schedule(self):
+        """Schedule the next heartbeat."""
+        self._due = time.monotonic() + self.interval
+        self._handle = self.loop.call_later(self.interval, self._beat)
+
+    def _beat(self):
+        """Record how late the heartbeat ran, reporting a block if over the threshold."""
+        lag = max(time.monotonic() - self._due, 0)
+        self.lags.append(lag)
+        capture, self._capture = self._capture, None
+        if lag > self.threshold:
+            # Ignore a capture of an earlier heartbeat that completed while it was taken
+            self._record(lag, capture[1] if capture and capture[0] == self._due else None)
+        self._schedule()
+
+    def _watch(self):
+        """Capture the loop thread's stack while the heartbeat is overdue."""
+        while not self._stopped.wait(self.threshold / 2):
+            due = self._due
+            if self._capture is not None or due is None or time.monotonic() - due < self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread)  # pylint: disable=protected-access
+            task = asyncio.current_task(self.loop)
+            self._capture = (due, {
+                "task": task.get_name() if task else None,
+                "coroutine": task.get_coro().__qualname__ if task else None,
+                "callback": running_handle(frame),
+                "stack": collapse(frame)[-STACK_DEPTH:] if frame else [],
+            })
+
+    def _record(self, lag, capture):
+        """Keep and log a block of the loop."""
+        self.blocked += 1
+        block = {"time": time.time(), "lag_ms": round(lag * 1000, 1)}
+        if capture:
+            block.update(capture)
+        self.blocks.append(block)
+
+        if capture and capture["stack"]:
+            _LOGGER.warning("Event loop blocked for %.0f ms in %s:\n  %s", lag * 1000,
+                            capture["coroutine"] or capture["callback"], "\n  ".join(capture["stack"]))
+        else:
+            _LOGGER.warning("Event loop blocked for %.0f ms", lag * 1000)
+
+    def stats(self):
+        """Return lag statistics and recent blocks for status reporting."""
+        lags = sorted(self.lags)
+        if not lags:
+            return {"blocked": self.blocked}
+        return {
+            "lag_ms_avg": round(sum(lags) / len(lags) * 1000, 2),
+            "lag_ms_p99": round(lags[min(int(0.99 * len(lags)), len(lags) - 1)] * 1000, 2),
+            "lag_ms_max": round(lags[-1] * 1000, 2),
+            "threshold_ms": round(self.threshold * 1000),
+            "blocked": self.blocked,
+            "recent_blocks": list(self.blocks),
+        }
@@ -0,0 +1,151 @@
+"""
+Latency of track changes, from the webhook or poll to the frame on screen.
+
+Every track change gets a `TrackTrace` of monotonic timestamps, one per stage
+reached. A stage's time runs from the end of the previous stage, so queueing
+between stages is counted in the stage that waited. Rolling percentiles per
+stage are served at `/metrics` in the Prometheus text format.
+"""
+from collections import deque
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+METRIC_PREFIX = "music_screen"
+WINDOW = 200
+QUANTILES = (0.5, 0.95, 0.99)
+TOTAL = "total"
+
+# In the order a track change passes through them
+STAGES = ("refresh", "demaster", "spotify", "artwork", "decode", "resize", "apply")
+
+
+class TrackTrace():
+    """Timestamps of the stages reached by one track change."""
+
+    def __init__(self, track_id, source, start=None):
+        """Start a trace at `start` (time.monotonic()), defaulting to now."""
+        self.track_id = track_id
+        self.source = source
+        self.start = start or time.monotonic()
+        self.marks = []
+
+    def mark(self, stage):
+        """Record the end of a stage."""
+        self.marks.append((stage, time.monotonic()))
+
+    def durations(self):
+        """Return (stage, seconds) for every stage reached, then the end to end time."""
+        durations = []
+        previous = self.start
+        for stage, timestamp in self.marks:
+            durations.append((stage, timestamp - previous))
+            previous = timestamp
+        durations.append((TOTAL, previous - self.start))
+        return durations
+
+
+def mark(job, stage):
+    """Mark a stage on the trace attached to a render job, if any."""
+    trace = getattr(job, "trace", None)
+    if trace is not None:
+        trace.mark(stage)
+
+
+class Histogram():
+    """Rolling window of samples with all-time count and sum."""
+
+    def __init__(self, window=WINDOW):
+        """Initialize the histogram."""
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Add a sample."""
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Return the nearest-rank quantiles of the window."""
+        values = sorted(self.samples)
+        if not values:
+            return {}
+        return {quantile: values[min(max(int(quantile * len(values) + 0.5) - 1, 0), len(values) - 1)]
+                for quantile in quantiles}
+
+
+class LatencyMetrics():
+    """Collect track change traces and report them."""
+
+    def __init__(self, slow_threshold=None, window=WINDOW):
+        """Initialize the metrics, logging every track change slower than `slow_threshold` seconds."""
+        self.slow_threshold = slow_threshold
+        self.window = window
+        self.histograms = {}
+        self.traces = 0
+        self.slow = 0
+        self.last_trace = None
+        self._counters = {}
+
+    def begin(self, track_id, source, start=None):
+        """Return a new trace for a track change."""
+        self.traces += 1
+        return TrackTrace(track_id, source, start)
+
+    def finish(self, trace):
+        """Record a trace once its frame is on screen."""
+        durations = trace.durations()
+        for stage, seconds in durations:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.window)
+            histogram.observe(seconds)
+        self.last_trace = trace
+
+        total = durations[-1][1]
+        if self.slow_threshold and total > self.slow_threshold:
+            self.slow += 1
+            _LOGGER.warning("Slow track change (%.0f ms from %s) for %s: %s", total * 1000, trace.source,
+                            trace.track_id, ", ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in durations[:-1]))
+        else:
+            _LOGGER.debug("Track change in %.0f ms", total * 1000)
+
+    def add_counters(self, name, provider):
+        """Also export the numeric values of the dict returned by `provider()`, e.g. a status provider."""
+        self._counters[name] = provider
+
+    def stats(self):
+        """Return percentiles in milliseconds per stage for status reporting."""
+        stats = {"traces": self.traces, "slow": self.slow}
+        for stage, histogram in self.histograms.items():
+            stats[stage] = {f"p{round(quantile * 100)}": round(value * 1000, 1)
+                            for quantile, value in histogram.quantiles().items()}
+        return stats
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        name = f"{METRIC_PREFIX}_track_change_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each stage of a track change, rolling window of {self.window}.",
+            f"# TYPE {name} summary",
+        ]
+        for stage in sorted(self.histograms, key=lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES)):
+            histogram = self.histograms[stage]
+            for quantile, value in histogram.quantiles().items():
+                lines.append(f'{name}{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        for metric, value in (("track_changes_total", self.traces), ("slow_track_changes_total", self.slow)):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} counter")
+            lines.append(f"{METRIC_PREFIX}_{metric} {value}")
+
+        for counter, provider in self._counters.items():
+            for key, value in provider().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"{METRIC_PREFIX}_{counter}_{key} {value}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,111 @@
+"""
+Adaptive polling of a room's `/state` when webhooks are not active.
+"""
+import asyncio
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+POLLING_INTERVAL = 1
+WEBHOOK_INTERVAL = 60
+IDLE_MAX_INTERVAL = 30
+# Keep polling at the base interval this long after a playback state change
+IDLE_GRACE = 30
+TRACK_END_WINDOW = 3
+TRACK_END_INTERVAL = 0.25
+
+
+class PollScheduler():
+    """Decide when a room is polled next and wake early on external updates."""
+
+    def __init__(self, sonos_data, poll, polling_interval=POLLING_INTERVAL,
+                 webhook_interval=WEBHOOK_INTERVAL, idle_max_interval=IDLE_MAX_INTERVAL, idle_grace=IDLE_GRACE):
+        """Initialize the scheduler with `poll`, a coroutine refreshing the room."""
+        self.sonos_data = sonos_data
+        self.poll = poll
+        self.polling_interval = polling_interval
+        self.webhook_interval = webhook_interval
+        self.idle_max_interval = idle_max_interval
+        self.idle_grace = idle_grace
+        self.interval = polling_interval
+        self.polls = 0
+        self.wakeups = 0
+        self._idle_interval = polling_interval
+        self._status = None
+        self._status_changed = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def next_interval(self, after_poll=True):
+        """Return the seconds to wait between the last update and the next poll."""
+        sonos_data = self.sonos_data
+        if sonos_data.status != self._status:
+            self._status = sonos_data.status
+            self._status_changed = time.monotonic()
+
+        if sonos_data.webhook_active:
+            return self.webhook_interval
+
+        if sonos_data.status == "PLAYING":
+            self._idle_interval = self.polling_interval
+            remaining = sonos_data.remaining_time()
+            if remaining is not None and remaining < TRACK_END_WINDOW:
+                # Catch the track change as soon as it happens
+                return TRACK_END_INTERVAL
+            return self.polling_interval
+
+        # Paused, stopped or unreachable: stay responsive to a quick resume, then back off
+        if time.monotonic() - self._status_changed < self.idle_grace:
+            self._idle_interval = self.polling_interval
+            return self.polling_interval
+
+        interval = self._idle_interval
+        if after_poll:
+            self._idle_interval = min(self._idle_interval * 2, self.idle_max_interval)
+        return interval
+
+    def wake(self):
+        """Re-evaluate the schedule now, e.g. after a webhook update."""
+        self._wakeup.set()
+
+    def start(self):
+        """Start the polling task."""
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        """Stop the polling task."""
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        """Poll whenever the chosen interval elapses without another update."""
+        self.interval = self.next_interval()
+        while True:
+            delay = self.sonos_data.last_update + self.interval - time.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    self.wakeups += 1
+                    self.interval = self.next_interval(after_poll=False)
+                    continue
+
+            try:
+                await self.poll()
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.exception("Polling %s failed: %s", self.sonos_data.room, err)
+            self.polls += 1
+            self.interval = self.next_interval()
+
+    def stats(self):
+        """Return scheduler state for status reporting."""
+        return {
+            "interval": self.interval,
+            "polls": self.polls,
+            "wakeups": self.wakeups,
+            "webhook_active": self.sonos_data.webhook_active,
+        }
@@ -0,0 +1,139 @@
+"""
+Background prefetching of the next track's artwork while the current track plays.
+"""
+import asyncio
+from collections import OrderedDict
+import logging
+from types import SimpleNamespace
+
+from image_ingest import decode_image
+from spotify_client import spotify_code_url
+
+_LOGGER = logging.getLogger(__name__)
+
+MAX_PREFETCHED = 4
+
+
+class ArtworkPrefetcher():
+    """Fetch, decode and pre-resize the artwork of the upcoming track."""
+
+    def __init__(self, display, fetch_image, clean_names=None, spotify_lookup=None, spotify_albumart=False):
+        """Initialize the prefetcher.
+
+        `fetch_image` is a coroutine returning image data for a URL, `clean_names`
+        an optional coroutine to demaster a list of names and `spotify_lookup` an optional
+        coroutine returning (Spotify code URI, album art URL).
+        """
+        self.display = display
+        self.fetch_image = fetch_image
+        self.clean_names = clean_names
+        self.spotify_lookup = spotify_lookup
+        self.spotify_albumart = spotify_albumart
+        self.prefetched = 0
+        self.used = 0
+        self.cancelled = 0
+        self.failed = 0
+        self._task = None
+        self._target = None
+        self._images = OrderedDict()
+
+    def schedule(self, sonos_data):
+        """Start prefetching the next track if it differs from the last one scheduled."""
+        target = (sonos_data.next_artist, sonos_data.next_trackname,
+                  sonos_data.next_album, sonos_data.next_uri, sonos_data.next_image_uri)
+        if target == self._target:
+            return
+        self._target = target
+
+        if self._task and not self._task.done():
+            self._task.cancel()
+            self.cancelled += 1
+
+        if not sonos_data.next_image_uri and not (
+                self.spotify_lookup and sonos_data.next_artist and sonos_data.next_trackname):
+            return
+
+        track_info = SimpleNamespace(
+            trackname=sonos_data.next_trackname,
+            artist=sonos_data.next_artist,
+            album=sonos_data.next_album,
+            station="",
+            uri=sonos_data.next_uri,
+            image_uri=sonos_data.next_image_uri,
+        )
+        self._task = asyncio.ensure_future(self._prefetch(track_info))
+
+    async def _prefetch(self, track_info):
+        """Retrieve and prepare everything the next redraw will need, logging any failure."""
+        try:
+            await self._fetch_next(track_info)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:  # pylint: disable=broad-except
+            self.failed += 1
+            _LOGGER.debug("Unable to prefetch next track %s - %s [%s]", track_info.artist, track_info.trackname, err)
+
+    async def _fetch_next(self, track_info):
+        """Demaster names, look up Spotify and fetch and decode the artwork of the next track."""
+        loop = asyncio.get_running_loop()
+
+        if self.clean_names:
+            track_info.trackname, track_info.album = await self.clean_names(
+                [track_info.trackname, track_info.album])
+
+        image_uri = track_info.image_uri
+        code_url = None
+        if self.spotify_lookup and track_info.artist and track_info.trackname:
+            # Also warms the lookup cache so the redraw pays no API round-trip
+            spotify_code_uri, spotify_albumart_uri = await self.spotify_lookup(
+                track_info.artist, track_info.trackname, track_info.uri)
+            code_url = spotify_code_url(spotify_code_uri)
+            if self.spotify_albumart and spotify_albumart_uri:
+                image_uri = spotify_albumart_uri
+
+        for url, track in ((image_uri, track_info), (code_url, None)):
+            if not url or url in self._images:
+                continue
+            data = await self.fetch_image(url)
+            if not data:
+                continue
+            try:
+                image = await loop.run_in_executor(None, self._prepare, data, track)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.debug("Unable to prefetch image %s [%s]", url, err)
+                continue
+            self._store(self._images, url, image)
+            self.prefetched += 1
+            _LOGGER.debug("Prefetched artwork for next track: %s", url)
+
+    @staticmethod
+    def _store(entries, key, value):
+        """Keep a prefetched entry, dropping the oldest beyond the limit."""
+        entries[key] = value
+        while len(entries) > MAX_PREFETCHED:
+            entries.popitem(last=False)
+
+    def _prepare(self, data, track_info):
+        """Decode image data and pre-resize album art for the display."""
+        if track_info is None:
+            return decode_image(data)
+
+        image = decode_image(data, self.display.SCREEN_W)
+        self.display.prewarm(image, track_info)
+        return image
+
+    def take_image(self, url):
+        """Return a prefetched image for a URL or None."""
+        image = self._images.pop(url, None)
+        if image is not None:
+            self.used += 1
+        return image
+
+    def stats(self):
+        """Return prefetch counters for status reporting."""
+        return {
+            "prefetched": self.prefetched,
+            "used": self.used,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+        }
@@ -0,0 +1,108 @@
+"""
+In-process sampling profiler for a running display.
+
+Stacks of every thread are sampled from `sys._current_frames()` by a
+background thread, so the event loop keeps running while it is profiled.
+Samples are aggregated as collapsed stacks, one `frame;frame;... count` line
+per distinct stack, which flamegraph.pl, speedscope and similar tools read
+directly. While sampling, the event loop's scheduling lag is measured too.
+"""
+import asyncio
+from collections import Counter
+import logging
+import os
+import sys
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.005
+LAG_INTERVAL = 0.05
+MAX_SECONDS = 120
+
+_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """A profile is already running."""
+
+
+def frame_name(frame):
+    """Return a frame as `function (file.py:line)`."""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def collapse(frame):
+    """Return the stack ending at `frame` as a list of frame names, outermost first."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def sample(seconds, interval=DEFAULT_INTERVAL):
+    """Sample the stacks of all other threads for `seconds`. Blocking.
+
+    Returns (number of samples, Counter of collapsed stacks prefixed with the thread name).
+    """
+    own_id = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if thread_id == own_id:
+                continue
+            stack = [names.get(thread_id, str(thread_id))] + collapse(frame)
+            stacks[";".join(stack)] += 1
+        samples += 1
+        time.sleep(interval)
+    return samples, stacks
+
+
+async def measure_loop_lag(seconds, interval=LAG_INTERVAL):
+    """Return how late the event loop ran sleeps of `interval` over `seconds`, in milliseconds."""
+    lags = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        lags.append(max(time.monotonic() - start - interval, 0) * 1000)
+    if not lags:
+        return {"checks": 0}
+    return {
+        "checks": len(lags),
+        "avg_ms": round(sum(lags) / len(lags), 2),
+        "max_ms": round(max(lags), 2),
+    }
+
+
+async def profile(seconds, interval=DEFAULT_INTERVAL):
+    """Profile all threads for `seconds` without blocking the event loop.
+
+    Returns a dict of the sample count, loop lag and collapsed stacks. Raises
+    ProfilerBusy if another profile is running.
+    """
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy
+    try:
+        _LOGGER.info("Profiling for %s seconds", seconds)
+        loop = asyncio.get_running_loop()
+        (samples, stacks), lag = await asyncio.gather(
+            loop.run_in_executor(None, sample, seconds, interval),
+            measure_loop_lag(seconds),
+        )
+    finally:
+        _lock.release()
+
+    return {"seconds": seconds, "samples": samples, "loop_lag": lag, "stacks": dict(stacks.most_common())}
+
+
+def collapsed(stacks):
+    """Return collapsed stacks as text, one `stack count` line each."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.items())
@@ -0,0 +1,99 @@
+"""
+Parse the artist, title and album out of radio stream titles.
+"""
+import functools
+import json
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+
+# BBC streams started via Alexa don't return their real name. If you find other stations which
+# are not shown then add them to radio_stations.json, and please share them with a pull request
+STATIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "radio_stations.json")
+UNKNOWN_STATION = "Radio"
+PARSE_CACHE_SIZE = 256
+
+# Separators in order of preference: the first one present anywhere in the title wins
+SEPARATORS = ("~", "˗", "*", "|", " - ", " / ")
+# The character each separator can't be present without, so one scan of the title rules most out
+SEPARATOR_CHARS = {separator: separator.strip() for separator in SEPARATORS}
+ALL_SEPARATOR_CHARS = frozenset(SEPARATOR_CHARS.values())
+
+BBC_PREFIX = "BR P|TYPE=SNG|"
+BBC_EMPTY_TITLE = "BR P|TYPE=SNG|TITLE |ARTIST |ALBUM"
+
+_STATIONS = None
+
+
+def find_separator(title):
+    """Return the preferred separator present in a title, or "" if there is none."""
+    present = ALL_SEPARATOR_CHARS.intersection(title)
+    if present:
+        for separator in SEPARATORS:
+            if SEPARATOR_CHARS[separator] in present and separator in title:
+                return separator
+    return ""
+
+
+def capitalize_words(text):
+    """Capitalize the first letter of every word, collapsing whitespace."""
+    return ' '.join(word[0].upper() + word[1:] for word in text.split())
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_radio_title(raw_trackname, station="", uri=""):
+    """Split a radio stream title into (trackname, artist, album).
+
+    Returns None if the title has no separator and should be shown as is.
+    """
+    separator = find_separator(raw_trackname)
+    if not separator:
+        return None
+
+    if raw_trackname.startswith(BBC_PREFIX):
+        if raw_trackname == BBC_EMPTY_TITLE:
+            if "bbc_radio" in uri:
+                trackname = "BBC " + station
+            else:
+                trackname = station
+            artist = ""
+        else:
+            fields = raw_trackname.split(separator)
+            artist = fields[3][7:]
+            trackname = fields[2][6:]
+        folded = None
+    else:
+        folded = raw_trackname.casefold().split(separator)
+        artist = capitalize_words(folded[0])
+        trackname = capitalize_words(folded[1])
+
+    if separator == "~":
+        if folded is None:
+            folded = raw_trackname.casefold().split(separator)
+        album = capitalize_words(folded[2])
+    else:
+        album = ""
+
+    return trackname, artist, album
+
+
+def load_stations(path=STATIONS_FILE):
+    """Load the table of stream file names to station names, returning its size."""
+    global _STATIONS
+    with open(path, encoding="utf-8") as stations_file:
+        _STATIONS = json.load(stations_file)
+    _LOGGER.debug("Loaded %s radio station names from %s", len(_STATIONS), path)
+    return len(_STATIONS)
+
+
+def find_station_name(filename):
+    """Return the station name of a stream file name, e.g. when played from Alexa."""
+    global _STATIONS
+    if _STATIONS is None:
+        try:
+            load_stations()
+        except (OSError, ValueError) as err:
+            _LOGGER.error("Could not load radio station names: %s", err)
+            _STATIONS = {}
+    return _STATIONS.get(filename, UNKNOWN_STATION)
@@ -0,0 +1,122 @@
+#This utility checks radio_metadata.py against the original radio title parsing and times both
+# Run using python3 radio_metadata_check.py [corpus_file]
+# A corpus file has one raw radio title per line, optionally followed by a tab, the station name, a tab and the track URI
+
+import sys
+import timeit
+
+import radio_metadata
+
+# Titles seen from various stations, covering every separator and the BBC formats
+CORPUS = [
+    ("Stevie Wonder - Living For The City", "", ""),
+    ("STEVIE WONDER - LIVING FOR THE CITY", "", ""),
+    ("Daft Punk ~ Around The World ~ Homework", "", ""),
+    ("daft punk~around the world~homework", "", ""),
+    ("Kraftwerk ˗ The Model", "", ""),
+    ("Kraftwerk*The Model*Computer World", "", ""),
+    ("Blondie|Heart Of Glass", "", ""),
+    ("Blondie | Heart Of Glass | Parallel Lines", "", ""),
+    ("The Cure / Lovesong", "", ""),
+    ("AC/DC - Back In Black", "", ""),
+    ("Simon & Garfunkel / The Boxer - Live", "", ""),
+    ("Air / - Sexy Boy", "", ""),
+    ("Jean-Michel Jarre - Oxygène, Pt. 4", "", ""),
+    ("Die Ärzte - Schrei Nach Liebe", "", ""),
+    ("Straße ~ Ein Lied ~ Groß", "", ""),
+    ("Now playing on Radio X", "", ""),
+    ("x-sonosapi-stream:s12345", "", ""),
+    ("bbc_6music.m3u8", "", ""),
+    ("BR P|TYPE=SNG|TITLE Heart Of Glass|ARTIST Blondie|ALBUM Parallel Lines", "Radio 2", "x-sonosapi-hls:bbc_radio_two"),
+    ("BR P|TYPE=SNG|TITLE |ARTIST |ALBUM", "Radio 2", "x-sonosapi-hls:bbc_radio_two"),
+    ("BR P|TYPE=SNG|TITLE |ARTIST |ALBUM", "6 Music", "x-sonosapi-hls:bbc_6music"),
+    ("  lots   of   space  -  between   words ", "", ""),
+]
+
+
+def original_parse(raw_trackname, station, uri):
+    # the parsing previously done inline in SonosData.set_track_info()
+    if raw_trackname.count("~") : c = "~"
+    elif raw_trackname.count("˗") : c = "˗"
+    elif raw_trackname.count("*") : c = "*"
+    elif raw_trackname.count("|") : c = "|"
+    elif raw_trackname.count(" - ") : c = " - "
+    elif raw_trackname.count(" / ") : c = " / "
+    else : c = ""
+
+    if not c:
+        return None
+
+    artist = album = ""
+    oldstr=raw_trackname.casefold()
+    splitstr = oldstr.split(c)
+    SplitStr = raw_trackname.split(c)
+    if raw_trackname.startswith("BR P|TYPE=SNG|") :
+        if raw_trackname == "BR P|TYPE=SNG|TITLE |ARTIST |ALBUM" :
+            if "bbc_radio" in uri :
+                raw_trackname = "BBC " + station
+            else :
+                raw_trackname = station
+            artist = ""
+        else :
+            artist = SplitStr[3][7:]
+            raw_trackname = SplitStr[2][6:]
+        if c == "~" :
+            album = ' '.join(word[0].upper() + word[1:] for word in splitstr[2].split())
+    else :
+        artist = ' '.join(word[0].upper() + word[1:] for word in splitstr[0].split())
+        raw_trackname = ' '.join(word[0].upper() + word[1:] for word in splitstr[1].split())
+        if c == "~" :
+            album = ' '.join(word[0].upper() + word[1:] for word in splitstr[2].split())
+
+    return raw_trackname, artist, album
+
+
+def outcome(parse, entry):
+    # compare exceptions as well as results, as malformed titles raise in both parsers
+    try:
+        return parse(*entry)
+    except Exception as err:
+        return type(err).__name__
+
+
+def load_corpus(path):
+    corpus = []
+    with open(path, encoding="utf-8") as corpus_file:
+        for line in corpus_file:
+            fields = line.rstrip("\n").split("\t") + ["", ""]
+            if fields[0]:
+                corpus.append(tuple(fields[:3]))
+    return corpus
+
+
+if len(sys.argv) > 1:
+    corpus = load_corpus(sys.argv[1])
+else:
+    corpus = CORPUS
+
+mismatches = 0
+for entry in corpus:
+    expected = outcome(original_parse, entry)
+    result = outcome(radio_metadata.parse_radio_title.__wrapped__, entry)
+    if result != expected:
+        mismatches += 1
+        print("MISMATCH: " + repr(entry[0]))
+        print("   original: " + repr(expected))
+        print("   new:      " + repr(result))
+
+print(str(len(corpus)) + " titles checked, " + str(mismatches) + " mismatches")
+
+# time both parsers over the corpus, and the memoized parser as used on every refresh
+rounds = 1000
+uncached = radio_metadata.parse_radio_title.__wrapped__
+timings = [
+    ("original", lambda: [outcome(original_parse, entry) for entry in corpus]),
+    ("new", lambda: [outcome(uncached, entry) for entry in corpus]),
+    ("new, memoized", lambda: [outcome(radio_metadata.parse_radio_title, entry) for entry in corpus]),
+]
+for name, run in timings:
+    seconds = min(timeit.repeat(run, number=rounds, repeat=3))
+    print(name + ": " + str(round(seconds / (rounds * len(corpus)) * 1e6, 2)) + " us per title")
+
+sys.exit(1 if mismatches else 0)
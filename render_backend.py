@@ -0,0 +1,539 @@
+"""
+Render backends for the high-res display.
+
+`RenderBackend` holds the layout and frame preparation shared by every backend.
+`DisplayController` shows frames with Tk, while `PILDisplay` composes them with
+PIL and writes them to a frame target such as a framebuffer device, without X.
+"""
+import abc
+from collections import deque
+import functools
+import logging
+import mmap
+import os
+import time
+from types import SimpleNamespace
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+from font_registry import truetype
+from render_cache import DEFAULT_MAX_BYTES, ResizeCache, image_key
+
+_LOGGER = logging.getLogger(__name__)
+
+SCREEN_SIZE = 720
+FRAME_TIMES = 100
+DEFAULT_FRAMEBUFFER = "/dev/fb0"
+DEFAULT_FRAME_FILE = "/dev/shm/music-screen-api.rgb"
+
+# Tk font sizes are in points, PIL font sizes in pixels
+POINTS_TO_PIXELS = 96 / 72
+FONT_PATHS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+    "DejaVuSansMono.ttf",
+)
+TRACK_WRAP = 600
+PLAY_STATE_WRAP = 700
+DETAIL_FONT_SIZE = 14
+SPOTIFY_CODE_BACKGROUND = "#368A7D"
+
+
+class SonosDisplaySetupError(Exception):
+    """Error connecting to Sonos display."""
+
+
+class RenderBackend(abc.ABC):  # pylint: disable=too-many-instance-attributes
+    """Layout and frame preparation shared by the display backends."""
+
+    def __init__(self, loop, show_details, show_artist_and_album, show_details_timeout, overlay_text, show_play_state, show_spotify_code, render_cache_size=DEFAULT_MAX_BYTES):
+        """Initialize the backend."""
+        self.SCREEN_W = SCREEN_SIZE
+        self.SCREEN_H = SCREEN_SIZE
+        self.THUMB_W = 0
+        self.THUMB_H = 0
+
+        self.loop = loop
+        self.show_details = show_details
+        self.show_artist_and_album = show_artist_and_album
+        self.show_details_timeout = show_details_timeout
+        self.overlay_text = overlay_text
+        self.show_play_state = show_play_state
+        self.show_spotify_code = show_spotify_code
+
+        self.timeout_future = None
+        self.is_showing = False
+        self.exporter = None
+        # Executor composing exported frames off the event loop, None for the loop's default
+        self.executor = None
+        self._export_generation = 0
+        self._rendered = {}
+        self.resize_cache = ResizeCache(render_cache_size)
+
+        # What is on screen, for composing it with PIL
+        self._frame = None
+        self._detail_view = False
+        self._blank = Image.new("RGB", (self.SCREEN_W, self.SCREEN_H), "black")
+
+    def build_track_text(self, track_info):
+        """Return the track name and detail line to display for a track."""
+        display_trackname = track_info.trackname or track_info.station
+
+        detail_text = ""
+        if self.show_artist_and_album:
+            detail_prefix = None
+            detail_suffix = track_info.album or None
+
+            if track_info.artist != display_trackname:
+                detail_prefix = track_info.artist
+
+            detail_text = " • ".join(filter(None, [detail_prefix, detail_suffix]))
+
+        return display_trackname, detail_text
+
+    def compute_layout(self, display_trackname, detail_text):
+        """Return the thumbnail length and track font size for the detail view."""
+        if self.show_artist_and_album:
+            if len(display_trackname) > 27:
+                if len(detail_text) > 54:
+                    thumb_length = 565
+                else:
+                    thumb_length = 590
+                if detail_text == "":
+                    font_size = 27
+                else:
+                    font_size = 22
+            else:
+                if len(detail_text) > 54:
+                    thumb_length = 600
+                else:
+                    thumb_length = 620
+                if detail_text == "":
+                    font_size = 37
+                    thumb_length = thumb_length + 20
+                else:
+                    font_size = 27
+
+            if len(display_trackname) > 27 and len(display_trackname) < 34:
+                thumb_length = thumb_length + 40
+
+        else:
+            if len(display_trackname) > 22:
+                thumb_length = 610
+                font_size = 27
+            else:
+                thumb_length = 640
+                font_size = 37
+
+            if len(display_trackname) > 22 and len(display_trackname) < 35:
+                thumb_length = thumb_length + 40
+
+        return thumb_length, font_size
+
+    def prewarm(self, image, track_info):
+        """Resize an upcoming track's artwork ahead of time. Safe to call from a worker thread."""
+        key = image_key(image)
+        self.resize_cache.resize(image, self.SCREEN_W, key=key)
+        if not self.overlay_text:
+            display_trackname, detail_text = self.build_track_text(track_info)
+            thumb_length, _ = self.compute_layout(display_trackname, detail_text)
+            self.resize_cache.resize(image, thumb_length, key=key)
+
+    def build_play_state_text(self, track_info):
+        """Return the play state line (volume, shuffle, repeat, crossfade) for a track."""
+        if not self.show_play_state:
+            return ""
+
+        play_state_volume = track_info.volume or None
+        play_state_shuffle = track_info.shuffle or None
+        play_state_repeat = track_info.repeat or None
+        play_state_crossfade = track_info.crossfade or None
+
+        play_state_volume_text = "Volume: " + str(play_state_volume)
+
+        play_state_shuffle_text = "Shuffle: " + str(play_state_shuffle).capitalize()
+
+        play_state_repeat_text = "Repeat: " + str(play_state_repeat).capitalize()
+
+        play_state_crossfade_text = "Crossfade: " + str(play_state_crossfade).capitalize()
+
+        return " • ".join(filter(None, [play_state_volume_text, play_state_shuffle_text, play_state_repeat_text, play_state_crossfade_text]))
+
+    def prepare(self, code_image, image, track_info):
+        """Compute text, layout and resized images for a frame. Safe to call from a worker thread."""
+        display_trackname, detail_text = self.build_track_text(track_info)
+        thumb_length, track_font_size = self.compute_layout(display_trackname, detail_text)
+
+        key = image_key(image)
+        album_frame = self.resize_cache.resize(image, self.SCREEN_W, key=key)
+        if self.overlay_text or thumb_length == self.SCREEN_W:
+            thumb_frame = album_frame
+        else:
+            thumb_frame = self.resize_cache.resize(image, thumb_length, key=key)
+
+        return SimpleNamespace(
+            track_id=getattr(track_info, "track_id", None) or "",
+            code_image=code_image,
+            album_frame=album_frame,
+            thumb_frame=thumb_frame,
+            thumb_length=thumb_length,
+            track_font_size=track_font_size,
+            display_trackname=display_trackname,
+            detail_text=detail_text,
+            play_state_text=self.build_play_state_text(track_info),
+        )
+
+    def _draw_label(self, draw, text, font, position, anchor, wrap):
+        """Draw white text on a black box, as Tk labels are drawn."""
+        text = wrap_text(text, font, wrap)
+        box = draw.multiline_textbbox(position, text, font=font, anchor=anchor, align="center")
+        draw.rectangle(box, fill="black")
+        draw.multiline_text(position, text, font=font, fill="white", anchor=anchor, align="center")
+
+    def screen_state(self):
+        """Return what compose() draws, a snapshot that can be handed to another thread."""
+        return self._frame, self.is_showing, self._detail_view
+
+    def compose(self, state=None):
+        """Return the image on screen, or for a `screen_state()` snapshot."""
+        frame, is_showing, detail_view = state or self.screen_state()
+        if not is_showing or frame is None:
+            return self._blank
+
+        canvas = self._blank.copy()
+        if detail_view:
+            if self.overlay_text:
+                thumb = frame.album_frame
+                thumb_y = (self.SCREEN_H - thumb.height) // 2
+            else:
+                thumb = frame.thumb_frame
+                thumb_y = frame.thumb_length // 2 - thumb.height // 2
+            canvas.paste(thumb, ((self.SCREEN_W - thumb.width) // 2, thumb_y))
+
+            draw = ImageDraw.Draw(canvas)
+            self._draw_label(draw, frame.display_trackname, load_font(frame.track_font_size),
+                             (self.SCREEN_W // 2, frame.thumb_length + 10), "ma", TRACK_WRAP)
+            if frame.detail_text and self.show_artist_and_album:
+                self._draw_label(draw, frame.detail_text, load_font(DETAIL_FONT_SIZE),
+                                 (self.SCREEN_W // 2, self.SCREEN_H - 10), "md", TRACK_WRAP)
+            if self.show_play_state and frame.play_state_text:
+                self._draw_label(draw, frame.play_state_text, load_font(DETAIL_FONT_SIZE),
+                                 (self.SCREEN_W // 2, 10), "ma", PLAY_STATE_WRAP)
+        else:
+            album = frame.album_frame
+            canvas.paste(album, ((self.SCREEN_W - album.width) // 2, (self.SCREEN_H - album.height) // 2))
+
+        if self.show_spotify_code and frame.code_image is not None and frame.detail_text != "":
+            code = frame.code_image
+            backdrop = Image.new("RGB", code.size, SPOTIFY_CODE_BACKGROUND)
+            if code.mode == "RGBA":
+                backdrop.paste(code, (0, 0), code)
+            else:
+                backdrop.paste(code.convert("RGB"), (0, 0))
+            canvas.paste(backdrop, (int(self.SCREEN_W * 0.75) - code.width // 2, 40))
+
+        return canvas
+
+    def export(self, image=None):
+        """Publish what is on screen to the frame exporter, if any.
+
+        Without an already composed `image` the screen is composed in `executor`,
+        skipping it if another export is requested before it runs.
+        """
+        if not self.exporter:
+            return
+
+        track_id = self._frame.track_id if self._frame else ""
+        if image is not None:
+            self.exporter.publish(image, track_id)
+            return
+
+        self._export_generation += 1
+        self.loop.run_in_executor(self.executor, self._compose_and_publish,
+                                  self._export_generation, self.screen_state(), track_id)
+
+    def _compose_and_publish(self, generation, state, track_id):
+        """Compose a screen snapshot and publish it, unless superseded. Runs in the executor."""
+        if generation != self._export_generation:
+            return
+        try:
+            self.exporter.publish(self.compose(state), track_id)
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning("Unable to export frame [%s]", err)
+
+    def replace_play_state(self, play_state_text):
+        """Update the play state of the frame on screen. Returns False if unchanged."""
+        if play_state_text == self._rendered.get("play_state_text"):
+            return False
+
+        self._rendered["play_state_text"] = play_state_text
+        if self._frame is not None:
+            self._frame = SimpleNamespace(**vars(self._frame))
+            self._frame.play_state_text = play_state_text
+        return True
+
+    @abc.abstractmethod
+    def apply(self, frame):
+        """Show a prepared frame. Must run on the event loop thread."""
+
+    @abc.abstractmethod
+    def update_play_state(self, track_info):
+        """Redraw only the play state line (volume, shuffle, repeat, crossfade)."""
+
+    @abc.abstractmethod
+    def show_album(self, show_details=None, detail_timeout=None):
+        """Show album with optional detail display and timeout."""
+
+    @abc.abstractmethod
+    def hide_album(self):
+        """Hide album if showing."""
+
+    def update(self, code_image, image, sonos_data):
+        """Update displayed image and text."""
+        self.apply(self.prepare(code_image, image, sonos_data))
+
+    def cleanup(self):
+        """Run cleanup actions."""
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(size):
+    """Return a monospaced PIL font for a Tk point size, or PIL's default font. Resolved once per size."""
+    pixels = round(size * POINTS_TO_PIXELS)
+    for font_path in FONT_PATHS:
+        try:
+            return truetype(font_path, pixels)
+        except OSError:
+            continue
+    _LOGGER.warning("No TrueType font found in %s, using the default font", FONT_PATHS)
+    return ImageFont.load_default()
+
+
+def wrap_text(text, font, width):
+    """Break text into lines no wider than `width` pixels, like a Tk label's wraplength."""
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = f"{line} {word}" if line else word
+            if line and font.getlength(candidate) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class MemoryTarget():
+    """Keep the last frame in memory, e.g. for benchmarks."""
+
+    def __init__(self, size=(SCREEN_SIZE, SCREEN_SIZE)):
+        self.size = size
+        self.image = None
+
+    def write(self, image):
+        """Keep a frame."""
+        self.image = image
+
+    def close(self):
+        """Release the frame."""
+        self.image = None
+
+
+class FileTarget():
+    """Write frames as raw RGB into a memory-mapped file, e.g. in /dev/shm for other processes."""
+
+    def __init__(self, path=DEFAULT_FRAME_FILE, size=(SCREEN_SIZE, SCREEN_SIZE)):
+        """Create or resize the file to hold one frame and map it."""
+        self.path = path
+        self.size = size
+        frame_bytes = size[0] * size[1] * 3
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, frame_bytes)
+            self._map = mmap.mmap(fd, frame_bytes)
+        finally:
+            os.close(fd)
+
+    def write(self, image):
+        """Copy a frame into the file."""
+        self._map[:] = image.tobytes()
+
+    def close(self):
+        """Unmap the file."""
+        self._map.close()
+
+
+class FramebufferTarget():
+    """Write frames straight into a Linux framebuffer device such as /dev/fb0."""
+
+    def __init__(self, path=DEFAULT_FRAMEBUFFER):
+        """Read the framebuffer geometry from sysfs and map the device."""
+        sysfs = os.path.join("/sys/class/graphics", os.path.basename(path))
+        width, height = (int(value) for value in self._read(sysfs, "virtual_size").split(","))
+        self.bits_per_pixel = int(self._read(sysfs, "bits_per_pixel"))
+        if self.bits_per_pixel not in (16, 24, 32):
+            raise ValueError(f"Unsupported framebuffer depth: {self.bits_per_pixel} bits per pixel")
+        try:
+            self.stride = int(self._read(sysfs, "stride"))
+        except OSError:
+            self.stride = width * self.bits_per_pixel // 8
+        self.size = (width, height)
+        self.path = path
+
+        fd = os.open(path, os.O_RDWR)
+        try:
+            self._map = mmap.mmap(fd, self.stride * height)
+        finally:
+            os.close(fd)
+        _LOGGER.info("Writing frames to %s (%sx%s, %s bpp)", path, width, height, self.bits_per_pixel)
+
+    @staticmethod
+    def _read(sysfs, name):
+        """Return the contents of a framebuffer sysfs attribute."""
+        with open(os.path.join(sysfs, name), encoding="ascii") as attribute:
+            return attribute.read().strip()
+
+    def _pixels(self, image):
+        """Return the frame in the framebuffer's pixel format."""
+        if self.bits_per_pixel == 32:
+            return image.tobytes("raw", "BGRX")
+        if self.bits_per_pixel == 24:
+            return image.tobytes("raw", "BGR")
+
+        # RGB565 little endian, built from lookup tables on each band
+        red, green, blue = image.split()
+        low = ImageChops.add(green.point(lambda v: ((v >> 2) & 7) << 5), blue.point(lambda v: v >> 3))
+        high = ImageChops.add(red.point(lambda v: v & 0xF8), green.point(lambda v: v >> 5))
+        return Image.merge("LA", (low, high)).tobytes()
+
+    def write(self, image):
+        """Copy a frame into the framebuffer, row by row if the rows are padded."""
+        if image.size != self.size:
+            canvas = Image.new("RGB", self.size, "black")
+            canvas.paste(image, (0, 0))
+            image = canvas
+
+        pixels = self._pixels(image)
+        row_bytes = len(pixels) // self.size[1]
+        if row_bytes == self.stride:
+            self._map[:len(pixels)] = pixels
+        else:
+            for row in range(self.size[1]):
+                offset = row * self.stride
+                self._map[offset:offset + row_bytes] = pixels[row * row_bytes:(row + 1) * row_bytes]
+
+    def close(self):
+        """Unmap the framebuffer."""
+        self._map.close()
+
+
+def open_target(backend, path=None):
+    """Return the frame target for a `display_backend` setting."""
+    try:
+        if backend == "framebuffer":
+            return FramebufferTarget(path or DEFAULT_FRAMEBUFFER)
+        if backend == "file":
+            return FileTarget(path or DEFAULT_FRAME_FILE)
+        if backend == "memory":
+            return MemoryTarget()
+    except (OSError, ValueError) as err:
+        _LOGGER.error("Cannot open %s display target: %s", backend, err)
+        raise SonosDisplaySetupError from err
+    _LOGGER.error("Unknown display backend: %s", backend)
+    raise SonosDisplaySetupError
+
+
+class PILDisplay(RenderBackend):
+    """Compose the Tk layout with PIL and write whole frames to a target, without Tk or X."""
+
+    def __init__(self, target, loop, show_details, show_artist_and_album, show_details_timeout, overlay_text, show_play_state, show_spotify_code, render_cache_size=DEFAULT_MAX_BYTES, backlight=None):
+        """Initialize the display with a frame target such as FramebufferTarget."""
+        super().__init__(loop, show_details, show_artist_and_album, show_details_timeout, overlay_text,
+                         show_play_state, show_spotify_code, render_cache_size)
+        self.target = target
+        self.backlight = backlight
+        self.frames = 0
+        self.frame_times = deque(maxlen=FRAME_TIMES)
+
+    def render(self):
+        """Compose the screen and write it to the target, timing both."""
+        start = time.perf_counter()
+        image = self.compose()
+        composed = time.perf_counter()
+        self.target.write(image)
+        written = time.perf_counter()
+
+        self.export(image)
+
+        self.frames += 1
+        self.frame_times.append((composed - start, written - composed))
+        _LOGGER.debug("Frame %s composed in %.1f ms, written in %.1f ms",
+                      self.frames, (composed - start) * 1000, (written - composed) * 1000)
+        return image
+
+    def show_album(self, show_details=None, detail_timeout=None):
+        """Show album with optional detail display and timeout."""
+        def handle_timeout():
+            self.timeout_future = None
+            self.show_album(show_details=False)
+
+        if show_details:
+            self._detail_view = True
+            if detail_timeout:
+                if self.timeout_future:
+                    self.timeout_future.cancel()
+                self.timeout_future = self.loop.call_later(detail_timeout, handle_timeout)
+        elif show_details is not None or detail_timeout is not None:
+            self._detail_view = False
+
+        self.is_showing = True
+        self.render()
+        if self.backlight:
+            self.backlight.set_power(True)
+
+    def hide_album(self):
+        """Hide album if showing."""
+        if self.timeout_future:
+            self.timeout_future.cancel()
+            self.timeout_future = None
+            self._detail_view = False
+
+        was_showing = self.is_showing
+        self.is_showing = False
+        if self.backlight:
+            self.backlight.set_power(False)
+        if was_showing:
+            self.render()
+        self._rendered.pop("code_image", None)
+
+    def apply(self, frame):
+        """Show a prepared frame."""
+        self._frame = frame
+        self._rendered = vars(frame).copy()
+        self.show_album(self.show_details, self.show_details_timeout)
+
+    def update_play_state(self, track_info):
+        """Redraw only the play state line (volume, shuffle, repeat, crossfade)."""
+        if self.replace_play_state(self.build_play_state_text(track_info)) and self.is_showing and self._detail_view:
+            self.render()
+
+    def stats(self):
+        """Return frame timings in milliseconds for status reporting."""
+        if not self.frame_times:
+            return {"frames": self.frames}
+        compose_times = [compose * 1000 for compose, _ in self.frame_times]
+        write_times = [write * 1000 for _, write in self.frame_times]
+        return {
+            "frames": self.frames,
+            "compose_ms_avg": round(sum(compose_times) / len(compose_times), 2),
+            "compose_ms_max": round(max(compose_times), 2),
+            "write_ms_avg": round(sum(write_times) / len(write_times), 2),
+            "write_ms_max": round(max(write_times), 2),
+        }
+
+    def cleanup(self):
+        """Run cleanup actions."""
+        if self.backlight:
+            self.backlight.cleanup()
+        self.target.close()
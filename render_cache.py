@@ -0,0 +1,75 @@
+"""
+Memory-bounded cache of resized album art frames for the high-res display.
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+
+from PIL import Image
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+def image_key(image):
+    """Return a hash identifying the pixel content of an image."""
+    digest = hashlib.md5(f"{image.mode}{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class ResizeCache():
+    """LRU cache of RGB frames keyed by (image hash, size, resample filter)."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """Initialize the cache."""
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._frames = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def resize(self, image, length, resample=Image.ANTIALIAS, key=None):
+        """Return the image resized to a square of `length`, reusing earlier work."""
+        if key is None:
+            key = image_key(image)
+        cache_key = (key, length, resample)
+
+        with self._lock:
+            frame = self._frames.get(cache_key)
+            if frame is not None:
+                self._frames.move_to_end(cache_key)
+                self.hits += 1
+                return frame
+            self.misses += 1
+
+        frame = image.convert("RGB").resize((length, length), resample)
+        size = length * length * 3
+        with self._lock:
+            if size <= self.max_bytes and cache_key not in self._frames:
+                self._frames[cache_key] = frame
+                self._total_bytes += size
+                self._evict()
+        return frame
+
+    def _evict(self):
+        """Drop least recently used frames until under the memory budget."""
+        while self._total_bytes > self.max_bytes:
+            (_, length, _), _ = self._frames.popitem(last=False)
+            self._total_bytes -= length * length * 3
+            self.evictions += 1
+
+    def stats(self):
+        """Return cache counters for status reporting."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "frames": len(self._frames),
+            "size": self._total_bytes,
+            "max_size": self.max_bytes,
+        }
@@ -0,0 +1,156 @@
+"""
+Staged render pipeline for the high-res display.
+
+Track changes flow through three stages connected by single-slot queues:
+fetch (network, on the event loop) -> prepare (decode and resize, in a worker
+thread) -> apply (Tk widget updates, on the event loop thread). Submitting a
+newer track supersedes any work still in flight so stale frames are never shown.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RenderPipeline():
+    """Run fetch, prepare and apply stages for the most recently submitted track."""
+
+    def __init__(self, fetch, prepare, apply, max_workers=1):
+        """Initialize the pipeline.
+
+        `fetch(job)` is a coroutine, `prepare(job, fetched)` a blocking callable run
+        in the worker pool and `apply(frame)` a callable run on the event loop.
+        """
+        self.fetch = fetch
+        self.prepare = prepare
+        self.apply = apply
+        self.generation = 0
+        self.submitted = 0
+        self.painted = 0
+        self.superseded = 0
+        self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render")
+        self._fetch_queue = asyncio.Queue(maxsize=1)
+        self._prepare_queue = asyncio.Queue(maxsize=1)
+        self._apply_queue = asyncio.Queue(maxsize=1)
+        self._fetch_task = None
+        self._workers = []
+
+    @property
+    def executor(self):
+        """Return the worker pool of the prepare stage."""
+        return self._executor
+
+    def start(self):
+        """Start the stage workers."""
+        self._workers = [
+            asyncio.ensure_future(self._fetch_worker()),
+            asyncio.ensure_future(self._prepare_worker()),
+            asyncio.ensure_future(self._apply_worker()),
+        ]
+
+    async def stop(self):
+        """Stop the stage workers and the worker pool."""
+        self.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+    def submit(self, job):
+        """Queue a job, superseding anything older still in the pipeline."""
+        self.cancel()
+        self.submitted += 1
+        self._put_latest(self._fetch_queue, (self.generation, job))
+
+    def cancel(self):
+        """Discard all in-flight work."""
+        self.generation += 1
+        if self._fetch_task and not self._fetch_task.done():
+            self._fetch_task.cancel()
+            self.superseded += 1
+        for queue in (self._fetch_queue, self._prepare_queue, self._apply_queue):
+            self._drain(queue)
+
+    def is_current(self, generation):
+        """Return True if work for a generation has not been superseded."""
+        return generation == self.generation
+
+    def _drain(self, queue):
+        """Drop any stale item waiting in a queue."""
+        while not queue.empty():
+            queue.get_nowait()
+            self.superseded += 1
+
+    def _put_latest(self, queue, item):
+        """Put an item in a single-slot queue, replacing what is waiting there."""
+        self._drain(queue)
+        queue.put_nowait(item)
+
+    async def _fetch_worker(self):
+        """Run network retrieval for the latest job."""
+        while True:
+            generation, job = await self._fetch_queue.get()
+            if not self.is_current(generation):
+                continue
+
+            task = self._fetch_task = asyncio.ensure_future(self.fetch(job))
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+
+            if task.cancelled() or not self.is_current(generation):
+                continue
+            if task.exception():
+                self.failed += 1
+                _LOGGER.error("Render fetch failed", exc_info=task.exception())
+                continue
+            self._put_latest(self._prepare_queue, (generation, job, task.result()))
+
+    async def _prepare_worker(self):
+        """Decode and resize in the worker pool."""
+        loop = asyncio.get_running_loop()
+        while True:
+            generation, job, fetched = await self._prepare_queue.get()
+            if not self.is_current(generation):
+                continue
+
+            try:
+                frame = await loop.run_in_executor(self._executor, self.prepare, job, fetched)
+            except Exception as err:  # pylint: disable=broad-except
+                self.failed += 1
+                _LOGGER.exception("Render prepare failed: %s", err)
+                continue
+
+            if not self.is_current(generation):
+                self.superseded += 1
+                continue
+            self._put_latest(self._apply_queue, (generation, frame))
+
+    async def _apply_worker(self):
+        """Apply prepared frames on the event loop (Tk) thread."""
+        while True:
+            generation, frame = await self._apply_queue.get()
+            if not self.is_current(generation):
+                continue
+
+            try:
+                self.apply(frame)
+            except Exception as err:  # pylint: disable=broad-except
+                self.failed += 1
+                _LOGGER.exception("Render apply failed: %s", err)
+                continue
+            self.painted += 1
+
+    def stats(self):
+        """Return pipeline counters for status reporting."""
+        return {
+            "generation": self.generation,
+            "submitted": self.submitted,
+            "painted": self.painted,
+            "superseded": self.superseded,
+            "failed": self.failed,
+        }
@@ -0,0 +1,236 @@
+"""
+Replay payloads recorded with the `capture_file` setting through the high-res
+display code, without a Sonos system, network or screen, and report how long
+each stage takes.
+
+Run using python3 replay_capture.py <capture_file> [--speed N] [--room NAME]
+A `sonos_settings.py` is required, e.g. a copy of `sonos_settings.py.example`.
+"""
+import argparse
+import asyncio
+import hashlib
+from io import BytesIO
+import json
+import logging
+import sys
+import time
+
+from PIL import Image
+
+from capture import read_capture
+from render_backend import MemoryTarget, PILDisplay
+from render_pipeline import RenderPipeline
+from sonos_user_data import SonosData
+
+import go_sonos_highres
+import sonos_settings
+
+_LOGGER = logging.getLogger(__name__)
+
+ARTWORK_SIZE = 640
+FRAME_TIMEOUT = 10
+STAGES = ("refresh", "redraw", "fetch", "prepare", "apply", "frame")
+
+
+class ReplayResponse():
+    """Minimal stand-in for an aiohttp response."""
+
+    def __init__(self, status=200, body=b"", content_type="application/json"):
+        self.status = status
+        self.headers = {"content-type": content_type}
+        self._body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    @property
+    def content(self):
+        return self
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self._body), size):
+            yield self._body[start:start + size]
+
+    async def read(self):
+        return self._body
+
+    async def json(self, content_type=None):
+        return json.loads(self._body)
+
+
+class ReplaySession():
+    """Serve recorded `/state` bodies and generated album art instead of the network."""
+
+    def __init__(self, artwork_size=ARTWORK_SIZE):
+        self.artwork_size = artwork_size
+        self.state = ReplayResponse(status=304)
+        self._artwork = {}
+
+    def get(self, url, **kwargs):
+        if url.endswith("/state"):
+            return self.state
+        return ReplayResponse(body=self.artwork(url), content_type="image/jpeg")
+
+    def artwork(self, url):
+        """Return JPEG data with a colour derived from the URL, the same for each URL."""
+        data = self._artwork.get(url)
+        if data is None:
+            colour = tuple(hashlib.md5(url.encode()).digest()[:3])
+            image = Image.new("RGB", (self.artwork_size, self.artwork_size), colour)
+            buffer = BytesIO()
+            image.save(buffer, "JPEG", quality=90)
+            data = self._artwork[url] = buffer.getvalue()
+        return data
+
+    async def close(self):
+        pass
+
+
+class StageTimer():
+    """Collect durations in milliseconds per stage."""
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def add(self, stage, start):
+        self.samples[stage].append((time.perf_counter() - start) * 1000)
+
+    def report(self):
+        """Return count, p50, p95, p99 and max of every stage with samples."""
+        report = {}
+        for stage, values in self.samples.items():
+            if not values:
+                continue
+            values = sorted(values)
+            report[stage] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1],
+            }
+        return report
+
+
+def percentile(sorted_values, pct):
+    """Return the nearest-rank percentile of sorted values."""
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def replay(entries, room, speed, artwork_size):
+    """Feed recorded payloads for a room through refresh() and redraw(), returning the stage timings."""
+    loop = asyncio.get_running_loop()
+    timer = StageTimer()
+    session = ReplaySession(artwork_size)
+    sonos_data = SonosData("replay", 0, room, session)
+    display = PILDisplay(
+        MemoryTarget(), loop, sonos_settings.show_details, sonos_settings.show_artist_and_album,
+        getattr(sonos_settings, "show_details_timeout", None), getattr(sonos_settings, "overlay_text", None),
+        getattr(sonos_settings, "show_play_state", None), go_sonos_highres.show_spotify_code,
+        getattr(sonos_settings, "render_cache_size_mb", 16) * 1024 * 1024)
+    frame_done = asyncio.Event()
+    submitted_at = []
+
+    async def fetch(track):
+        start = time.perf_counter()
+        artwork = await go_sonos_highres.fetch_artwork(session, track)
+        timer.add("fetch", start)
+        return artwork
+
+    def prepare(track, artwork):
+        start = time.perf_counter()
+        frame = go_sonos_highres.prepare_frame(display, track, artwork)
+        timer.add("prepare", start)
+        return frame
+
+    def apply(frame):
+        start = time.perf_counter()
+        display.apply(frame)
+        timer.add("apply", start)
+        timer.add("frame", submitted_at[-1])
+        frame_done.set()
+
+    pipeline = RenderPipeline(fetch, prepare, apply)
+    pipeline.start()
+
+    first_time = entries[0]["time"]
+    started = time.monotonic()
+    for entry in entries:
+        if speed:
+            delay = (entry["time"] - first_time) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        if entry["kind"] == "webhook":
+            payload = entry["payload"]
+        else:
+            payload = None
+            body = entry["body"]
+            session.state = ReplayResponse(
+                status=entry["status"], body=body.encode("utf-8") if body is not None else b"")
+
+        start = time.perf_counter()
+        await sonos_data.refresh(payload)
+        timer.add("refresh", start)
+
+        submitted = pipeline.submitted
+        frame_done.clear()
+        start = time.perf_counter()
+        await go_sonos_highres.redraw(session, sonos_data, display, pipeline)
+        timer.add("redraw", start)
+
+        if pipeline.submitted != submitted:
+            # Wait for the frame so each one is measured on its own
+            submitted_at.append(start)
+            try:
+                await asyncio.wait_for(frame_done.wait(), FRAME_TIMEOUT)
+            except asyncio.TimeoutError:
+                _LOGGER.warning("Frame not painted within %s seconds", FRAME_TIMEOUT)
+
+    await pipeline.stop()
+    return timer.report(), pipeline.painted
+
+
+def main():
+    """Parse arguments, replay the capture and print the report."""
+    parser = argparse.ArgumentParser(description="Replay a payload capture and report per-stage latency")
+    parser.add_argument("capture_file")
+    parser.add_argument("--room", help="room to replay, defaults to the first room in the capture")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="replay speed relative to the recording, 0 (default) replays as fast as possible")
+    parser.add_argument("--artwork-size", type=int, default=ARTWORK_SIZE,
+                        help="side in pixels of the generated album art")
+    parser.add_argument("--json", dest="json_file", help="also write the report to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(levelname)7s - %(message)s", level=logging.WARNING)
+
+    # Never leave the machine: demaster offline only
+    sonos_settings.demaster_query_cloud = False
+
+    entries = list(read_capture(args.capture_file))
+    room = args.room or (entries[0]["room"] if entries else None)
+    entries = [entry for entry in entries if entry["room"] == room]
+    if not entries:
+        print("No payloads to replay")
+        sys.exit(1)
+
+    report, frames = asyncio.run(replay(entries, room, args.speed, args.artwork_size))
+
+    print(f"Replayed {len(entries)} payloads for {room}, {frames} frames painted")
+    print(f"{'stage':<10}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, result in report.items():
+        print(f"{stage:<10}{result['count']:>8}{result['p50']:>10.2f}{result['p95']:>10.2f}"
+              f"{result['p99']:>10.2f}{result['max']:>10.2f}")
+
+    if args.json_file:
+        with open(args.json_file, "w", encoding="utf-8") as json_file:
+            json.dump({"room": room, "payloads": len(entries), "frames": frames, "stages": report}, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Registry of monitored Sonos rooms sharing one aiohttp session.
+"""
+import logging
+
+from poll_scheduler import POLLING_INTERVAL, WEBHOOK_INTERVAL, PollScheduler
+from sonos_user_data import SonosData
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RoomRegistry():
+    """Hold a SonosData instance per room and dispatch updates to subscribers."""
+
+    def __init__(self, api_host, api_port, session, recorder=None):
+        """Initialize the registry, recording every room's payloads to `recorder` if given."""
+        self.api_host = api_host
+        self.api_port = api_port
+        self.session = session
+        self.recorder = recorder
+        self._rooms = {}
+        self._subscribers = {}
+        self._persistent = set()
+        self._schedulers = {}
+        self._polling = None
+
+    def __contains__(self, room):
+        """Return True if a room is monitored."""
+        return room in self._rooms
+
+    def add_room(self, room, persistent=False):
+        """Start monitoring a room, returning its SonosData.
+
+        Persistent rooms stay monitored when their subscribers move elsewhere.
+        """
+        if persistent:
+            self._persistent.add(room)
+        if room not in self._rooms:
+            self._rooms[room] = SonosData(self.api_host, self.api_port, room, self.session, self.recorder)
+            self._subscribers[room] = []
+            _LOGGER.info("Monitoring room: %s", room)
+            if self._polling:
+                self._start_scheduler(room)
+        return self._rooms[room]
+
+    def get(self, room):
+        """Return the SonosData for a room or None."""
+        return self._rooms.get(room)
+
+    def rooms(self):
+        """Return the names of all monitored rooms."""
+        return list(self._rooms)
+
+    def subscribe(self, room, callback):
+        """Call `await callback(sonos_data)` after every update of a room."""
+        self.add_room(room)
+        self._subscribers[room].append(callback)
+
+    def move_subscribers(self, old_room, new_room):
+        """Move the subscribers of one room to another, dropping the old room if unused."""
+        if old_room == new_room or old_room not in self._rooms:
+            return self.add_room(new_room)
+
+        new_data = self.add_room(new_room)
+        # Make the next refresh report the current track as new to the moved subscribers
+        new_data.previous_track = None
+
+        self._subscribers[new_room].extend(self._subscribers[old_room])
+        self._subscribers[old_room] = []
+        if old_room not in self._persistent:
+            del self._rooms[old_room]
+            del self._subscribers[old_room]
+            scheduler = self._schedulers.pop(old_room, None)
+            if scheduler:
+                scheduler.stop()
+            _LOGGER.info("Stopped monitoring room: %s", old_room)
+        return new_data
+
+    async def dispatch(self, room, payload=None):
+        """Refresh a room from a webhook payload (or a poll if None) and notify subscribers."""
+        sonos_data = self._rooms.get(room)
+        if sonos_data is None:
+            return False
+
+        await sonos_data.refresh(payload)
+        for callback in self._subscribers[room]:
+            await callback(sonos_data)
+        if payload is not None and room in self._schedulers:
+            self._schedulers[room].wake()
+        return True
+
+    def start_polling(self, polling_interval=POLLING_INTERVAL, webhook_interval=WEBHOOK_INTERVAL):
+        """Poll every monitored room on an adaptive schedule."""
+        self._polling = (polling_interval, webhook_interval)
+        for room in self._rooms:
+            self._start_scheduler(room)
+
+    def stop_polling(self):
+        """Stop polling all rooms."""
+        self._polling = None
+        for scheduler in self._schedulers.values():
+            scheduler.stop()
+        self._schedulers = {}
+
+    def _start_scheduler(self, room):
+        """Create and start the poll scheduler for a room."""
+        async def poll():
+            await self.dispatch(room)
+
+        polling_interval, webhook_interval = self._polling
+        scheduler = PollScheduler(self._rooms[room], poll, polling_interval, webhook_interval)
+        self._schedulers[room] = scheduler
+        scheduler.start()
+
+    def polling_stats(self):
+        """Return the poll scheduler state of every room."""
+        return {room: scheduler.stats() for room, scheduler in self._schedulers.items()}
@@ -2,36 +2,55 @@
 Helper class to retrieve and process data from `node-http-sonos-api`.
 """
 from datetime import timedelta
+import hashlib
+import json
 import logging
 import re
 import time
+from types import SimpleNamespace
 from urllib.parse import urljoin
 import sonos_settings
 
 from aiohttp import ClientConnectorError
 
+from radio_metadata import find_station_name, parse_radio_title
+
 
 _LOGGER = logging.getLogger(__name__)
 
 WEBHOOK_TIMEOUT = 130
 
+# State fields which change while playing without affecting what is displayed
+ELAPSED_FIELDS = ("elapsedTime", "elapsedTimeFormatted")
+
 
 class SonosData():
     """Holds all data related to the chosen Sonos speaker."""
 
-    def __init__(self, api_host, api_port, sonos_room, session):
-        """Initialize the object."""
+    def __init__(self, api_host, api_port, sonos_room, session, recorder=None):
+        """Initialize the object, recording every payload to `recorder` if given."""
         self.api_host = api_host
         self.api_port = api_port
         self.last_poll = 0
         self.last_webhook = 0
+        self.refresh_started = 0
+        self.refresh_source = None
         self.previous_image_uri = None
         self.previous_track = None
         self.room = sonos_room
         self.session = session
+        self.recorder = recorder
         self.webhook_active = False
         self._speaker_uri = None
         self._track_is_new = True
+        self.previous_play_state = None
+        self._play_state_is_new = False
+        self._etag = None
+        self._raw_digest = None
+        self._previous_state = None
+        self._track_id = None
+        self._clean_names = None
+        self.payload_stats = {"skipped_raw": 0, "skipped_track": 0, "processed": 0}
 
         self.type = ""
         self.raw_trackname = ""
@@ -39,10 +58,19 @@ class SonosData():
         self.artist = ""
         self.album = ""
         self.station = ""
+        self.uri = ""
         self.duration = 0
+        self.elapsed = 0
+        self.elapsed_at = 0
         self.image_uri = ""
         self.status = ""
 
+        self.next_trackname = ""
+        self.next_artist = ""
+        self.next_album = ""
+        self.next_uri = ""
+        self.next_image_uri = ""
+
         self.volume = 0
         self.repeat = ""
         self.shuffle = ""
@@ -54,11 +82,6 @@ class SonosData():
             return self.last_webhook
         return self.last_poll
 
-    def set_room(self, room):
-        """Change the actively monitored room."""
-        self.room = room
-        _LOGGER.info("Monitoring room: %s", room)
-
     def get_speaker_uri(self, json_data):
         """Return the speaker's URL based on the state JSON."""
         if self._speaker_uri:
@@ -71,16 +94,56 @@ class SonosData():
             _LOGGER.debug("URL for %s found: %s", self.room, self._speaker_uri)
             return self._speaker_uri
 
+    def remaining_time(self):
+        """Return the estimated seconds left in the current track, or None if unknown."""
+        if not self.duration or not self.elapsed_at:
+            return None
+        return self.duration - self.elapsed - (time.monotonic() - self.elapsed_at)
+
     def is_playing(self):
         """Return True if actively playing."""
         return self.status == "PLAYING"
 
+    def set_clean_names(self, trackname, album):
+        """Set the demastered track and album names to display for the current track."""
+        self._clean_names = (self.previous_track, trackname, album)
+
+    def snapshot(self):
+        """Return a copy of the track attributes needed to render the display.
+
+        The track and album names are the demastered ones if set for the current track.
+        """
+        trackname, album = self.trackname, self.album
+        if self._clean_names and self._clean_names[0] == self.previous_track:
+            _, trackname, album = self._clean_names
+        return SimpleNamespace(
+            room=self.room,
+            track_id=self.previous_track,
+            type=self.type,
+            trackname=trackname,
+            artist=self.artist,
+            album=album,
+            station=self.station,
+            uri=self.uri,
+            image_uri=self.image_uri,
+            volume=self.volume,
+            repeat=self.repeat,
+            shuffle=self.shuffle,
+            crossfade=self.crossfade,
+        )
+
     def is_track_new(self):
         """Return True if the track has changed since last update."""
         is_new = self._track_is_new
         self._track_is_new = False
         return is_new
 
+    def is_play_state_new(self):
+        """Return True if volume, shuffle, repeat or crossfade changed since last update."""
+        is_new = self._play_state_is_new
+        self._play_state_is_new = False
+        return is_new
+
     def set_track_info(self, payload):
 
         """Update attributes from the JSON payload. Returns new track_id or None."""
@@ -100,43 +163,9 @@ class SonosData():
               self.raw_trackname = self.station
 
            if self.artist == self.station and self.type == "radio" :
-              if self.raw_trackname.count("~") : c = "~"
-              elif self.raw_trackname.count("˗") : c = "˗"
-              elif self.raw_trackname.count("*") : c = "*"
-              elif self.raw_trackname.count("|") : c = "|"
-              elif self.raw_trackname.count(" - ") : c = " - "
-              elif self.raw_trackname.count(" / ") : c = " / "
-              else : c = ""
-
-              if c :
-                 oldstr=self.raw_trackname.casefold()
-                 splitstr = oldstr.split(c)
-                 SplitStr = self.raw_trackname.split(c)
-                 if self.raw_trackname.startswith("BR P|TYPE=SNG|") :
-                    if self.raw_trackname == "BR P|TYPE=SNG|TITLE |ARTIST |ALBUM" :
-                        if "bbc_radio" in self.uri :
-                            self.raw_trackname = "BBC " + self.station
-                        else :
-                            self.raw_trackname = self.station
-                        self.artist = ""
-                    else : 
-                        #self.artist = ' '.join(word[0].upper() + word[1:] for word in splitstr[3].split())[6:]
-                        self.artist = SplitStr[3][7:]
-                        #self.raw_trackname = ' '.join(word[0].upper() + word[1:] for word in splitstr[2].split())[5:]
-                        self.raw_trackname = SplitStr[2][6:]
-                    if c == "~" :
-                        self.album = ' '.join(word[0].upper() + word[1:] for word in splitstr[2].split())
-                    else :
-                        self.album = ""
-    #                    self.album = self.station
-                 else :
-                    self.artist = ' '.join(word[0].upper() + word[1:] for word in splitstr[0].split())
-                    self.raw_trackname = ' '.join(word[0].upper() + word[1:] for word in splitstr[1].split())
-                    if c == "~" :
-                        self.album = ' '.join(word[0].upper() + word[1:] for word in splitstr[2].split())
-                    else :
-                        self.album = ""
-    #                    self.album = self.station
+              parsed = parse_radio_title(self.raw_trackname, self.station, self.uri)
+              if parsed :
+                 self.raw_trackname, self.artist, self.album = parsed
 
         # Abort update if all data is empty
         if not any([self.album, self.artist, self.duration, self.station, self.raw_trackname]):
@@ -145,7 +174,7 @@ class SonosData():
 
         if self.type == "radio" and not self.station:
             # if not then try to look it up (usually because its played from Alexa)
-            self.station = find_unknown_radio_station_name(self.raw_trackname)
+            self.station = find_station_name(self.raw_trackname)
 
         # Clear uninteresting tracknames
         if self.raw_trackname.startswith("x-sonosapi-") or self.raw_trackname.endswith(".m3u8"):
@@ -166,37 +195,25 @@ class SonosData():
 
         return track_id
 
-    async def refresh(self, payload=None):
-        """Refresh the Sonos media data with provided payload or a new get request."""
-        if payload:
-            if not self.webhook_active:
-                _LOGGER.info("Switching to webhook updates")
-            self.last_webhook = time.time()
-            self.webhook_active = True
-            obj = payload
+    def set_next_track_info(self, payload):
+        """Update the upcoming track attributes from the JSON payload."""
+        next_track = payload.get('nextTrack', {})
+        self.next_trackname = next_track.get('title', "")
+        self.next_artist = next_track.get('artist', "")
+        self.next_album = next_track.get('album', "")
+        self.next_uri = next_track.get('uri', "")
+
+        album_art_uri = next_track.get('albumArtUri', "")
+        speaker_uri = self._speaker_uri
+        if album_art_uri.startswith('http'):
+            self.next_image_uri = album_art_uri
+        elif speaker_uri and album_art_uri:
+            self.next_image_uri = f"{speaker_uri}{album_art_uri}"
         else:
-            self.last_poll = time.time()
-            base_url = f"http://{self.api_host}:{self.api_port}"
-            url = urljoin(base_url, f"{self.room}/state")
-
-            try:
-                async with self.session.get(url) as response:
-                    obj = await response.json()
-            except ClientConnectorError as err:
-                self.status = "API error"
-                _LOGGER.error("Connection failed. Ensure `node-sonos-http-api` is running: (%s)", err)
-                return
-            except Exception as err:
-                self.status = "API error"
-                _LOGGER.exception("Error connecting to Sonos API: %s", err)
-                return
-
-        self.status = obj.get('playbackState', "API error")
-
-        # Don't bother processing the payload unless media is actively playing
-        if self.status != "PLAYING":
-            return
+            self.next_image_uri = next_track.get('absoluteAlbumArtUri', "")
 
+    def set_state(self, obj):
+        """Update all track attributes from a playing state. Returns the track_id or None."""
         self.type = obj['currentTrack']['type']
         self.duration = obj['currentTrack']['duration']
 
@@ -215,7 +232,7 @@ class SonosData():
             track_id = self.set_track_info(obj)
 
             if not track_id:
-                return
+                return None
 
             album_art_uri = obj['currentTrack'].get('albumArtUri', "")
             speaker_uri = self.get_speaker_uri(obj)
@@ -226,6 +243,89 @@ class SonosData():
             else:
                 self.image_uri = obj['currentTrack'].get('absoluteAlbumArtUri', "")
 
+            self.set_next_track_info(obj)
+
+        play_state = (self.volume, self.shuffle, self.repeat, self.crossfade)
+        if play_state != self.previous_play_state:
+            self.previous_play_state = play_state
+            self._play_state_is_new = True
+
+        return track_id
+
+    async def refresh(self, payload=None):
+        """Refresh the Sonos media data with provided payload or a new get request."""
+        self.refresh_started = time.monotonic()
+        self.refresh_source = "webhook" if payload else "poll"
+        if payload:
+            if not self.webhook_active:
+                _LOGGER.info("Switching to webhook updates")
+            self.last_webhook = time.time()
+            self.webhook_active = True
+            if self.recorder:
+                self.recorder.record_webhook(self.room, payload)
+            # The next poll can't be compared against a response older than this payload
+            self._etag = None
+            self._raw_digest = None
+            obj = payload
+        else:
+            self.last_poll = time.time()
+            base_url = f"http://{self.api_host}:{self.api_port}"
+            url = urljoin(base_url, f"{self.room}/state")
+            headers = {"If-None-Match": self._etag} if self._etag else None
+
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status == 304:
+                        raw = None
+                    else:
+                        raw = await response.read()
+                        self._etag = response.headers.get("ETag")
+                    if self.recorder:
+                        self.recorder.record_poll(self.room, raw, response.status)
+                obj = None
+                if raw is not None:
+                    raw_digest = hashlib.sha1(raw).hexdigest()
+                    if raw_digest != self._raw_digest:
+                        obj = json.loads(raw)
+                        self._raw_digest = raw_digest
+            except ClientConnectorError as err:
+                self._forget_payload()
+                self.status = "API error"
+                _LOGGER.error("Connection failed. Ensure `node-sonos-http-api` is running: (%s)", err)
+                return
+            except Exception as err:
+                self._forget_payload()
+                self.status = "API error"
+                _LOGGER.exception("Error connecting to Sonos API: %s", err)
+                return
+
+        if obj is None:
+            # Same response as the last poll, nothing to parse
+            self.payload_stats["skipped_raw"] += 1
+            if self.status != "PLAYING":
+                return
+            track_id = self._track_id
+        else:
+            self.status = obj.get('playbackState', "API error")
+            self.elapsed = obj.get('elapsedTime', 0)
+            self.elapsed_at = time.monotonic()
+
+            # Don't bother processing the payload unless media is actively playing
+            if self.status != "PLAYING":
+                return
+
+            state = {key: value for key, value in obj.items() if key not in ELAPSED_FIELDS}
+            if state == self._previous_state:
+                self.payload_stats["skipped_track"] += 1
+                track_id = self._track_id
+            else:
+                self.payload_stats["processed"] += 1
+                self._previous_state = state
+                track_id = self._track_id = self.set_state(obj)
+
+        if not track_id:
+            return
+
         if track_id != self.previous_track:
             _LOGGER.info("New track: %s", track_id)
         elif self.image_uri != self.previous_image_uri:
@@ -241,22 +341,8 @@ class SonosData():
             _LOGGER.warning("Webhook activity timed out, falling back to polling")
             self.webhook_active = False
 
-
-
-def find_unknown_radio_station_name(filename):
-    # BBC streams started via alexa don't return their real name, which is annoying... but fixable:
-    # if you find other stations which are not shown then you can add them below. Please put up on github will a pull request if you do
-    if filename == "bbc_radio_two.m3u8": return "BBC Radio 2"
-    if filename == "bbc_6music.m3u8": return "BBC Radio 6 Music"
-    if filename == "bbc_radio_hereford_worcester.m3u8": return "BBC Hereford & Worcester"
-    if filename == "bbc_radio_one.m3u8": return "BBC Radio 1"
-    if filename == "bbc_1xtra.m3u8": return "BBC Radio 1Xtra"
-    if filename == "bbc_radio_two.m3u8": return "BBC Radio 2"
-    if filename == "bbc_radio_three.m3u8": return "BBC Radio 3"
-    if filename == "bbc_radio_fourfm.m3u8": return "BBC Radio 4"
-    if filename == "bbc_radio_five_live.m3u8": return "BBC Radio 5 Live"
-    if filename == "bbc_radio_five_live_sports_extra.m3u8": return "BBC Radio 5 Live Sports Extra"
-    if filename == "bbc_world_service.m3u8": return "BBC World Service"
-
-    # if not found:
-    return "Radio"
+    def _forget_payload(self):
+        """Make the next response be fully processed, e.g. after an error."""
+        self._etag = None
+        self._raw_digest = None
+        self._previous_state = None
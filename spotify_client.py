@@ -0,0 +1,160 @@
+"""
+Asynchronous Spotify Web API lookups for Spotify Codes and album art.
+Reuses one client-credentials access token and caches search results.
+"""
+import asyncio
+from collections import OrderedDict
+import logging
+import re
+import time
+
+from aiohttp import BasicAuth, ClientError, ClientTimeout
+
+_LOGGER = logging.getLogger(__name__)
+
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+SEARCH_URL = "https://api.spotify.com/v1/search"
+SPOTIFY_CODE_PATH = "https://scannables.scdn.co/uri/plain/png/368A7D/white/320/"
+
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+DEFAULT_CACHE_SIZE = 500
+TOKEN_EXPIRY_MARGIN = 60
+# Fall back to the Sonos album art rather than hold up the display
+REQUEST_TIMEOUT = ClientTimeout(total=5)
+QUOTE_PATTERN = re.compile("´|`|'|’")
+
+
+class SpotifyAuthError(Exception):
+    """Error obtaining a Spotify access token."""
+
+
+def spotify_code_url(spotify_code_uri):
+    """Return the scannable Spotify Code image URL for a Spotify URI."""
+    if spotify_code_uri is None:
+        return None
+    return f"{SPOTIFY_CODE_PATH}{spotify_code_uri}"
+
+
+class SpotifyLookup():
+    """Search Spotify over a shared aiohttp session with token reuse and a TTL/LRU cache."""
+
+    def __init__(self, session, client_id, client_secret, market=None,
+                 cache_ttl=DEFAULT_CACHE_TTL, cache_size=DEFAULT_CACHE_SIZE):
+        """Initialize the lookup service."""
+        self.session = session
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.market = market
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.api_requests = 0
+        self.token_refreshes = 0
+        self._token = None
+        self._token_expires = 0
+        self._cache = OrderedDict()
+
+    async def _get_token(self, force=False):
+        """Return a valid access token, requesting a new one only when expired."""
+        if not force and self._token and time.monotonic() < self._token_expires:
+            return self._token
+
+        auth = BasicAuth(self.client_id, self.client_secret)
+        try:
+            async with self.session.post(
+                    TOKEN_URL, data={"grant_type": "client_credentials"}, auth=auth,
+                    timeout=REQUEST_TIMEOUT) as response:
+                if response.status != 200:
+                    raise SpotifyAuthError(f"HTTP {response.status}")
+                payload = await response.json()
+        except ClientError as err:
+            raise SpotifyAuthError(err) from err
+
+        self._token = payload["access_token"]
+        self._token_expires = time.monotonic() + payload.get("expires_in", 3600) - TOKEN_EXPIRY_MARGIN
+        self.token_refreshes += 1
+        _LOGGER.debug("Authorising Spotify developer account successful")
+        return self._token
+
+    async def _search_api(self, artist, trackname):
+        """Query the Spotify search endpoint for the top track match."""
+        params = {
+            "q": "artist:" + QUOTE_PATTERN.sub("", artist) + " track:" + QUOTE_PATTERN.sub("", trackname),
+            "type": "track",
+            "limit": 1,
+        }
+        if self.market:
+            params["market"] = self.market
+
+        for retry in (False, True):
+            token = await self._get_token(force=retry)
+            self.api_requests += 1
+            async with self.session.get(
+                    SEARCH_URL, params=params, headers={"Authorization": f"Bearer {token}"},
+                    timeout=REQUEST_TIMEOUT) as response:
+                if response.status == 401 and not retry:
+                    # Token revoked or expired early, fetch a fresh one and try again
+                    continue
+                response.raise_for_status()
+                return await response.json()
+
+    async def search(self, artist, trackname):
+        """Return the (track URI, album art URL) of the top match, or (None, None)."""
+        key = (artist, trackname, self.market)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+
+        try:
+            results = await self._search_api(artist, trackname)
+        except SpotifyAuthError as err:
+            _LOGGER.warning("Problem authorising Spotify developer account, please check your credentials in sonos_settings.py are correct [%s]", err)
+            return None, None
+        except asyncio.TimeoutError:
+            _LOGGER.warning("Spotify search timed out, defaulting to Sonos system")
+            return None, None
+        except (ClientError, ValueError) as err:
+            _LOGGER.warning("Problem searching Spotify, defaulting to Sonos system [%s]", err)
+            return None, None
+
+        result = (None, None)
+        try:
+            if results['tracks']['total'] != 0:
+                top_result = results['tracks']['items'][0]
+                result = (top_result['uri'], top_result['album']['images'][0]['url'])
+        except (KeyError, IndexError) as err:
+            _LOGGER.warning("Unexpected Spotify search response, defaulting to Sonos system [%s]", err)
+            return None, None
+
+        self._cache[key] = (time.monotonic() + self.cache_ttl, result)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def lookup(self, artist, trackname, sonos_uri):
+        """Return the (Spotify Code URI, album art URL) to display for a track."""
+        uri, spotify_albumart_uri = await self.search(artist, trackname)
+        if uri is None:
+            return None, None
+
+        _LOGGER.debug("Spotify album art URI successfully obtained: %s", spotify_albumart_uri)
+        if sonos_uri.startswith('x-sonos-spotify:'):
+            spotify_code_uri = sonos_uri.replace('x-sonos-spotify:', '')
+        else:
+            spotify_code_uri = uri
+        _LOGGER.debug("Spotify Code URI successfully obtained: %s", spotify_code_uri)
+        return spotify_code_uri, spotify_albumart_uri
+
+    def stats(self):
+        """Return lookup counters for status reporting."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "api_requests": self.api_requests,
+            "token_refreshes": self.token_refreshes,
+            "cached": len(self._cache),
+        }
@@ -1,17 +1,43 @@
 """Helper class to handle webhook callbacks from node-sonos-http-api and various REST commands."""
+import asyncio
 import copy
 from distutils.util import strtobool
+import logging
 
 from aiohttp import web
 
+import profiler
+
+_LOGGER = logging.getLogger(__name__)
+
 
 class SonosWebhook:
-    def __init__(self, display, sonos_data, callback):
-        """Initialize the webhook handler."""
-        self.callback = callback
+    def __init__(self, display, registry, room):
+        """Initialize the webhook handler for a registry of rooms, `room` being the displayed one."""
         self.display = display
+        self.registry = registry
+        self.room = room
         self.runner = None
-        self.sonos_data = sonos_data
+        self.status_providers = {}
+        self.frame_source = None
+        self.metrics = None
+
+    @property
+    def sonos_data(self):
+        """Return the data for the displayed room."""
+        return self.registry.get(self.room)
+
+    def add_status_provider(self, name, provider):
+        """Include the result of `provider()` under `name` in the status report."""
+        self.status_providers[name] = provider
+
+    def set_frame_source(self, frame_source):
+        """Serve the latest frame of `frame_source` (a FrameExporter) at `/frame.png`."""
+        self.frame_source = frame_source
+
+    def set_metrics(self, metrics):
+        """Serve `metrics.render()` (a LatencyMetrics) at `/metrics`."""
+        self.metrics = metrics
 
     async def listen(self):
         """Start listening server."""
@@ -22,6 +48,9 @@ class SonosWebhook:
                 web.get("/status", self.get_status),
                 web.post("/set-room", self.set_room),
                 web.post("/show-detail", self.show_detail),
+                web.get("/frame.png", self.get_frame),
+                web.get("/metrics", self.get_metrics),
+                web.get("/debug/profile", self.get_profile),
             ]
         )
         self.runner = web.AppRunner(app)
@@ -31,19 +60,78 @@ class SonosWebhook:
 
     async def get_status(self, request):
         """Report the status of the application."""
-        payload = copy.copy(vars(self.sonos_data))
+        sonos_data = self.registry.get(request.query.get("room", self.room))
+        if sonos_data is None:
+            return web.HTTPNotFound(reason="Room not monitored")
+
+        payload = copy.copy(vars(sonos_data))
         payload.pop("session")
+        payload.pop("recorder")
+        payload.pop("_previous_state")
+        payload["monitored_rooms"] = self.registry.rooms()
+        for name, provider in self.status_providers.items():
+            payload[name] = provider()
         return web.json_response(payload)
 
+    async def get_frame(self, request):
+        """Return the frame currently on screen as PNG."""
+        if self.frame_source is None:
+            return web.HTTPNotFound(reason="Frame export not enabled")
+
+        data = await asyncio.get_running_loop().run_in_executor(None, self.frame_source.png)
+        if data is None:
+            return web.HTTPNotFound(reason="No frame yet")
+        return web.Response(body=data, content_type="image/png")
+
+    async def get_metrics(self, request):
+        """Return latency metrics in the Prometheus text format."""
+        if self.metrics is None:
+            return web.HTTPNotFound(reason="Metrics not enabled")
+        return web.Response(text=self.metrics.render(), content_type="text/plain")
+
+    async def get_profile(self, request):
+        """Sample the stacks of all threads for `seconds` and return them collapsed, or as JSON with `format=json`."""
+        try:
+            seconds = float(request.query.get("seconds", 10))
+        except ValueError:
+            return web.HTTPBadRequest(reason="Parameter 'seconds' must be a number")
+        if not 0 < seconds <= profiler.MAX_SECONDS:
+            return web.HTTPBadRequest(reason=f"Parameter 'seconds' must be between 0 and {profiler.MAX_SECONDS}")
+
+        try:
+            result = await profiler.profile(seconds)
+        except profiler.ProfilerBusy:
+            return web.HTTPConflict(reason="Profile already running")
+
+        if request.query.get("format") == "json":
+            return web.json_response(result)
+
+        lag = result["loop_lag"]
+        headers = {
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Loop-Lag-Avg-Ms": str(lag.get("avg_ms", 0)),
+            "X-Loop-Lag-Max-Ms": str(lag.get("max_ms", 0)),
+        }
+        return web.Response(text=profiler.collapsed(result["stacks"]), content_type="text/plain", headers=headers)
+
     async def set_room(self, request):
         """Set the monitored room."""
         payload = await request.post()
         room = payload.get("room")
-        self.sonos_data.set_room(room)
+        if not room:
+            return web.HTTPBadRequest(reason="Parameter 'room' must be provided")
+
+        self.registry.move_subscribers(self.room, room)
+        self.room = room
+        _LOGGER.info("Displaying room: %s", room)
+        await self.registry.dispatch(room)
         return web.Response(text="OK")
 
     async def show_detail(self, request):
         """Set the monitored room."""
+        if self.display is None:
+            return web.HTTPNotFound(reason="Display does not support details")
+
         if not self.sonos_data.is_playing():
             return web.HTTPBadRequest(reason="Not playing")
 
@@ -63,9 +151,7 @@ class SonosWebhook:
         """Handle a webhook received from node-sonos-http-api."""
         json = await request.json()
         if json["type"] == "transport-state":
-            if json["data"]["roomName"] == self.sonos_data.room:
-                await self.sonos_data.refresh(json["data"]["state"])
-                await self.callback()
+            await self.registry.dispatch(json["data"]["roomName"], json["data"]["state"])
         return web.Response(text="OK")
 
     async def stop(self):